@@ -0,0 +1,731 @@
+import os
+import sys
+import time
+import json
+import random
+import platform
+import socket
+import asyncio
+import argparse
+import contextlib
+import subprocess
+import tempfile
+import threading
+import itertools
+import operator
+import tracemalloc
+import importlib.util
+from datetime import datetime
+
+# Load main-code.py as a module (its file name is not importable directly)
+_spec = importlib.util.spec_from_file_location("main_code", os.path.join(os.path.dirname(os.path.abspath(__file__)), "main-code.py"))
+shop = importlib.util.module_from_spec(_spec)
+sys.modules["main_code"] = shop
+_spec.loader.exec_module(shop)
+
+
+def measure(fn, *args):
+    # Returns (result, seconds, peak traced bytes); timed and traced in separate runs so tracing doesn't skew timings
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def sample_purchase(i):
+    return {
+        "username": f"user{i % 1000}",
+        "first_name": "Bench",
+        "last_name": "Mark",
+        "date": "08-07-2024 \t23:45:05",
+        "items": [{"title": f"Product-{(i + j) % 500}", "price": 1000 + j, "quantity": 1 + j} for j in range(3)],
+        "total_bill": 6009,
+        "address": "street, landmark, city, state",
+    }
+
+
+# Record format benchmark: legacy repr()/eval() lines against the codecs
+def bench_codecs(args):
+    records = [sample_purchase(i) for i in range(args.records)]
+    with tempfile.TemporaryDirectory() as database_dir:
+        files = shop.FileManagement(database_dir)
+        legacy_filename = os.path.join(database_dir, "legacy.txt")
+        with open(legacy_filename, 'w') as f:
+            for record in records:
+                f.write(f"{record}\n")
+
+        def load_legacy():
+            # The loader this repo used before the codecs existed
+            with open(legacy_filename, 'r') as f:
+                data = f.readlines()
+            return [eval(line) for line in data if line.strip()]
+
+        results = [("repr/eval (legacy)", load_legacy, os.path.getsize(legacy_filename))]
+        for name in sorted(shop.RECORD_CODECS):
+            filename = os.path.join(database_dir, f"{name}.txt")
+            files.write_records(filename, records, shop.RECORD_CODECS[name]())
+            results.append((name, lambda filename=filename: sum(1 for _ in files.iter_records(filename)), os.path.getsize(filename)))
+            results.append((f"{name} (list)", lambda filename=filename: list(files.iter_records(filename)), os.path.getsize(filename)))
+
+        print(f"{'format':<22}{'load s':>10}{'records/s':>14}{'peak MiB':>11}{'file MiB':>11}")
+        for name, loader, size in results:
+            _, elapsed, peak = measure(loader)
+            print(f"{name:<22}{elapsed:>10.3f}{args.records / elapsed:>14,.0f}{peak / 2**20:>11.1f}{size / 2**20:>11.1f}")
+
+
+# Inventory stress test: many threads hammering one hot SKU through separate carts
+def bench_inventory(args):
+    inventory = shop.InventoryEngine(hold_ttl=args.ttl, reap_interval=0.01)
+    inventory.start_reaper()
+    product = shop.Product("Hot-SKU", 999, args.stock)
+    carts = [shop.Cart(inventory) for _ in range(args.threads)]
+    operations = [0] * args.threads
+    start_line = threading.Barrier(args.threads)
+
+    def shopper(n):
+        cart = carts[n]
+        start_line.wait()
+        for i in range(args.attempts):
+            cart.add_to_cart(product, 1)
+            if i % 4 == 3:
+                cart.remove_from_cart(product.title, 1)  # Churn: give some stock back
+            operations[n] += 1
+
+    threads = [threading.Thread(target=shopper, args=(n,)) for n in range(args.threads)]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # Keep cart messages out of the timings
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    held = sum(cart.item_count for cart in carts)
+    print(f"threads={args.threads} attempts/thread={args.attempts} stock={args.stock}")
+    print(f"throughput: {sum(operations) / elapsed:,.0f} cart operations/s")
+    print(f"when shoppers finished: held in carts={held} left in stock={product.stock_quantity}")
+    # Held + remaining must always equal the starting stock; anything more would be overselling
+    assert product.stock_quantity >= 0 and held + product.stock_quantity == args.stock, "oversold"
+    time.sleep(args.ttl + 0.1)  # Let every abandoned hold expire
+    inventory.stop()
+    held = sum(cart.item_count for cart in carts)
+    print(f"after TTL: held in carts={held} left in stock={product.stock_quantity}")
+    assert product.stock_quantity == args.stock and held == 0, "expired holds were not returned"
+    print("no overselling; all expired holds returned to stock")
+
+
+AUDITED_CALLS = {"open": 0, "os.mkdir": 0}
+
+
+def count_audited_calls(event, args):
+    if event in AUDITED_CALLS:
+        AUDITED_CALLS[event] += 1
+
+
+def write_syscalls():
+    # Linux-only: write()/writev() syscalls issued by this process so far (pwrite is not counted)
+    try:
+        with open("/proc/self/io") as f:
+            return int(next(line for line in f if line.startswith("syscw:")).split()[1])
+    except (OSError, StopIteration):
+        return 0
+
+
+# Checkout burst: direct per-order appends against the group-commit writer
+def bench_checkouts(args):
+    records = [sample_purchase(i) for i in range(args.orders)]
+    print(f"{args.threads} threads, {args.orders} orders over {args.users} users")
+    sys.addaudithook(count_audited_calls)  # Counts open() and mkdir() calls
+    print(f"{'mode':<12}{'orders/s':>10}{'opens/order':>13}{'mkdirs/order':>14}{'writes/order':>14}{'fsyncs':>8}{'avg batch':>11}")
+    for mode in ["direct"] + list(shop.PurchaseWriter.FSYNC_POLICIES):
+        with tempfile.TemporaryDirectory() as database_dir:
+            files = shop.FileManagement(database_dir)
+            if mode != "direct":
+                files.purchase_writer = shop.PurchaseWriter(files, fsync_policy=mode)
+            per_thread = args.orders // args.threads
+
+            def checkout_burst(n):
+                for i in range(n * per_thread, (n + 1) * per_thread):
+                    files.save_purchase_history(f"user{i % args.users}", records[i])
+
+            threads = [threading.Thread(target=checkout_burst, args=(n,)) for n in range(args.threads)]
+            writes = write_syscalls()
+            audited = dict(AUDITED_CALLS)
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if files.purchase_writer is not None:
+                files.purchase_writer.close()
+            elapsed = time.perf_counter() - start
+            files.close()
+            writes = write_syscalls() - writes
+            opens = AUDITED_CALLS["open"] - audited["open"]
+            mkdirs = AUDITED_CALLS["os.mkdir"] - audited["os.mkdir"]
+            total = per_thread * args.threads
+            writer = files.purchase_writer
+            fsyncs = writer.fsyncs if writer else 0
+            batch = writer.records_written / max(1, writer.batches) if writer else 1
+            print(f"{mode:<12}{total / elapsed:>10,.0f}{opens / total:>13.2f}{mkdirs / total:>14.2f}{writes / total:>14.2f}{fsyncs:>8}{batch:>11.1f}")
+
+
+# Login throughput against the number of password-hashing processes
+def bench_logins(args):
+    cores = os.cpu_count() or 1
+    worker_counts = [0] + sorted({1, 2, cores // 2 or 1, cores})
+    with tempfile.TemporaryDirectory() as database_dir:
+        user_ops = shop.UserOperations(database_dir, hasher=shop.PasswordHasher(args.scrypt_n, workers=0))
+        for i in range(args.users):
+            user_ops.register("Bench", "Mark", f"user{i}", "password123")
+        print(f"scrypt n={args.scrypt_n}, {args.threads} concurrent logins, {cores} cores")
+        print(f"{'hash workers':<14}{'logins/s':>10}")
+        for workers in worker_counts:
+            user_ops.hasher = shop.PasswordHasher(args.scrypt_n, workers=workers)
+            user_ops.authenticate("user0", "password123")  # Start the pool outside the timing
+            per_thread = args.logins // args.threads
+
+            def log_in(n):
+                for i in range(per_thread):
+                    assert user_ops.authenticate(f"user{(n + i) % args.users}", "password123") is not None
+
+            threads = [threading.Thread(target=log_in, args=(n,)) for n in range(args.threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            label = "inline" if workers == 0 else str(workers)
+            print(f"{label:<14}{per_thread * args.threads / elapsed:>10,.1f}")
+            user_ops.hasher.shutdown()
+
+
+class DictProduct:
+    # The Product layout before __slots__ and the product table: one object with a __dict__ per product
+    def __init__(self, title, price, stock_quantity):
+        self.title = title
+        self.price = price
+        self.stock_quantity = stock_quantity
+
+
+def retained(build):
+    # Returns (result, bytes still allocated once build() returns)
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+# Catalog representation benchmark: list of objects against the array-backed product table
+def bench_catalog(args):
+    rng = random.Random(1)
+    rows = [(rng.randrange(499, 20000), rng.randrange(0, 5000)) for _ in range(args.products)]
+    with tempfile.TemporaryDirectory() as database_dir:
+        seed = shop.ProductCatalog(shop.CatalogSnapshot(database_dir))
+        for i, (price, stock) in enumerate(rows):
+            seed.add(shop.Product(f"Product-{i:07d}", price, stock))
+        seed.close()
+        del seed
+
+        def open_table():
+            return shop.ProductTable(shop.CatalogSnapshot(database_dir))
+
+        layouts = [
+            # Titles are built inside each layout so every one pays for its own strings
+            ("list of objects (__dict__)", lambda: [DictProduct(f"Product-{i:07d}", price, stock) for i, (price, stock) in enumerate(rows)]),
+            ("list of Product (__slots__)", lambda: [shop.Product(f"Product-{i:07d}", price, stock) for i, (price, stock) in enumerate(rows)]),
+            ("product table", open_table),  # Titles stay in the mapped catalog.dat, outside the Python heap
+        ]
+        print(f"{'layout':<30}{'MiB':>9}{'B/product':>11}{'iterate s':>11}{'columns s':>11}")
+        for name, build in layouts:
+            products, size = retained(build)
+            if isinstance(products, shop.ProductTable):
+                table = products
+                _, iterate, _ = measure(lambda: sum(view.price * view.stock_quantity for view in map(table.view, range(len(table)))))
+                _, columns, _ = measure(lambda: sum(map(operator.mul, table.prices, table.stock)))
+                table.snapshot.close()
+            else:
+                _, iterate, _ = measure(lambda: sum(product.price * product.stock_quantity for product in products))
+                columns = None
+            print(f"{name:<30}{size / 2**20:>9.1f}{size / args.products:>11.0f}{iterate:>11.3f}{'' if columns is None else f'{columns:.3f}':>11}")
+            del products
+        print(f"(product table titles are read from the mapped catalog.dat: {os.path.getsize(os.path.join(database_dir, 'catalog.dat')) / 2**20:.1f} MiB on disk)")
+
+
+# Session benchmark: memory held as concurrent shoppers grow, bounded LRU against keeping every session in memory
+def bench_sessions(args):
+    with tempfile.TemporaryDirectory() as database_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        store = shop.StoreOperations("Bench Store", database_dir, hold_ttl=3600)
+        products = [store.add_product(f"Product-{i:04d}", 999 + i, 10**9) for i in range(100)]
+        users = {f"user{i}": shop.User("Bench", "Mark", f"user{i}", "x") for i in range(max(args.shoppers))}
+        results = []
+        for shoppers in args.shoppers:
+            for capacity in (args.capacity, shoppers):
+                tracemalloc.start()
+                sessions = shop.SessionManager(store, users, capacity=capacity)
+                start = time.perf_counter()
+                tokens = []
+                for i in range(shoppers):
+                    token = sessions.open(users[f"user{i}"])
+                    with sessions.use(token) as user:
+                        user.cart.add_many((products[(i + j) % len(products)], 1) for j in range(3))
+                    tokens.append(token)
+                elapsed = time.perf_counter() - start
+                held = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                start = time.perf_counter()
+                restored = min(100, shoppers)
+                for token in tokens[:restored]:  # The oldest sessions: spilled unless everything fits
+                    sessions.release(sessions.acquire(token))
+                restore = (time.perf_counter() - start) / restored
+                results.append((shoppers, capacity, held, elapsed, restore, sessions.spills))
+                sessions.close_all()
+        store.catalog.close()
+        store.storage.close()
+    print(f"{'shoppers':>9}{'capacity':>10}{'held MiB':>10}{'B/shopper':>11}{'open+add/s':>12}{'get ms':>9}{'spills':>8}")
+    for shoppers, capacity, held, elapsed, restore, spills in results:
+        print(f"{shoppers:>9}{capacity:>10}{held / 2**20:>10.1f}{held / shoppers:>11.0f}{shoppers / elapsed:>12,.0f}{restore * 1000:>9.3f}{spills:>8}")
+
+
+# Synthetic dataset: users, a persisted product catalog and an order log of purchase histories at configurable sizes
+def generate_dataset(database_dir, users, products, orders, seed=1, scrypt_n=2**14):
+    rng = random.Random(seed)
+    os.makedirs(database_dir, exist_ok=True)
+    files = shop.FileManagement(database_dir)
+    password = shop.PasswordHasher(scrypt_n, workers=0).hash("password123")  # One real hash shared by every account
+    first_names = ["Ali", "Sara", "Omar", "Hina", "Bilal", "Ayesha", "Usman", "Zara"]
+    last_names = ["Khan", "Ahmed", "Malik", "Butt", "Sheikh", "Raza", "Iqbal", "Chaudhry"]
+    files.write_records(files.users_filename, (
+        {"first_name": rng.choice(first_names), "last_name": rng.choice(last_names), "username": f"user{i}", "password": password}
+        for i in range(users)
+    ))
+
+    catalog = [{"title": f"Product-{i:06d}", "price": rng.randrange(499, 20000), "stock_quantity": rng.randrange(50, 5000)} for i in range(products)]
+    products_catalog = shop.ProductCatalog(shop.CatalogSnapshot(database_dir))
+    for product in catalog:
+        products_catalog.add(shop.Product(**product))
+    products_catalog.close()  # Checkpoint into catalog.dat
+
+    # Zipf-like popularity: a few heavy buyers and best sellers, a long tail of both
+    user_weights = [1 / (rank + 1) ** 0.8 for rank in range(users)]
+    scale = orders / sum(user_weights)
+    order_counts = [int(weight * scale) for weight in user_weights]
+    for i in range(orders - sum(order_counts)):
+        order_counts[i % users] += 1
+    product_weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(products)))
+    now = int(time.time())
+    order_log = files.order_log
+    purchases = []
+    for i, count in enumerate(order_counts):
+        username = f"user{i}"
+        for timestamp in sorted(rng.randrange(now - 365 * 86400, now) for _ in range(count)):
+            lines = {}
+            for product in rng.choices(catalog, cum_weights=product_weights, k=rng.randint(1, 4)):
+                line = lines.setdefault(product["title"], {"title": product["title"], "price": product["price"], "quantity": 0})
+                line["quantity"] += rng.randint(1, 3)
+            items = list(lines.values())
+            purchases.append((username, {
+                "username": username,
+                "first_name": "Bench",
+                "last_name": "Mark",
+                "date": datetime.fromtimestamp(timestamp).strftime(shop.PURCHASE_DATE_FORMAT),
+                "items": items,
+                "total_bill": sum(item["price"] * item["quantity"] for item in items),
+                "address": "street, landmark, city, state",
+            }))
+            if len(purchases) >= 1024:
+                order_log.append(purchases)
+                purchases = []
+    order_log.append(purchases)
+    order_log.sync()
+    order_log.compact()  # Start from a folded index, as a long-running store would be
+    order_log.close()
+
+
+def bench_generate(args):
+    start = time.perf_counter()
+    generate_dataset(args.out, args.users, args.products, args.orders, args.seed, args.scrypt_n)
+    print(f"Wrote {args.users} users, {args.products} products and {args.orders} orders to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(shop.__file__)).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def run_operation(fn, samples, setup=None, memory_samples=20):
+    # Times each call separately; peak memory comes from a shorter traced pass
+    latencies = []
+    for i in range(samples):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    for i in range(min(samples, memory_samples)):
+        if setup is not None:
+            setup(i)
+        tracemalloc.reset_peak()
+        fn(i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies.sort()
+    return {
+        "samples": samples,
+        "ops_per_sec": samples / sum(latencies) if sum(latencies) else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+# Repeatable suite over the store's hot paths; results go to JSON for comparing commits
+def bench_suite(args):
+    temp_dir = None
+    database_dir = args.database_dir
+    if database_dir is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        database_dir = temp_dir.name
+        generate_dataset(database_dir, args.users, args.products, args.orders, args.seed, args.scrypt_n)
+    rng = random.Random(args.seed)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database_dir": args.database_dir or "generated",
+            "users": args.users, "products": args.products, "orders": args.orders,
+        },
+        "operations": {},
+    }
+    operations = results["operations"]
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # Store methods print to the console
+            files = shop.FileManagement(database_dir)
+            operations["load_users_data"] = run_operation(lambda i: files.load_users_data(), args.repeats)
+            user_ops = shop.UserOperations(database_dir, hasher=shop.PasswordHasher(args.scrypt_n, workers=0))
+            usernames = list(user_ops.users)
+            operations["catalog_open"] = run_operation(lambda i: shop.ProductCatalog(shop.CatalogSnapshot(database_dir)).snapshot.close(), args.repeats)
+            store = shop.StoreOperations("Bench Store", database_dir, hold_ttl=3600)
+            products = list(store.products)
+            titles = [product.title.lower() for product in products]
+            operations["find_product"] = run_operation(lambda i: store.find_product(rng.choice(titles)), args.samples)
+
+            operations["login"] = run_operation(lambda i: user_ops.authenticate(rng.choice(usernames), "password123"), args.login_samples)
+            shopper = user_ops.authenticate(usernames[0], "password123")
+            store.attach_cart(shopper)
+            operations["add_to_cart"] = run_operation(lambda i: shopper.cart.add_to_cart(rng.choice(products), 1), args.samples)
+            shopper.cart.checkout_snapshot()
+            operations["checkout"] = run_operation(
+                lambda i: store.checkout("street, landmark, city, state", shopper, "cod", feedback=""), args.samples,
+                setup=lambda i: shopper.cart.add_many((rng.choice(products), 1) for _ in range(3)),
+            )
+            buyers = [username for username in usernames if files.count_purchase_history(username)]
+            operations["load_purchase_history"] = run_operation(lambda i: files.load_purchase_history(rng.choice(buyers)), args.samples)
+            operations["load_purchase_history_newest_10"] = run_operation(lambda i: files.load_purchase_history(rng.choice(buyers), limit=10), args.samples)
+            store.catalog.close()
+            store.storage.close()  # Flushes the purchase writer, then closes the order log
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    print(f"commit {results['meta']['commit']}: {args.users} users, {args.products} products, {args.orders} orders")
+    print(f"{'operation':<34}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>11}")
+    for name, result in operations.items():
+        print(f"{name:<34}{result['ops_per_sec']:>12,.1f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['peak_kib']:>11,.0f}")
+    output = args.json or os.path.join("bench_results", f"{results['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+# Storage backends side by side: one generated dataset, imported into each backend, the same operations on both
+def bench_backends(args):
+    rows = []
+    with tempfile.TemporaryDirectory() as database_dir:
+        generate_dataset(database_dir, args.users, args.products, args.orders, args.seed, args.scrypt_n)
+        for backend in shop.STORAGE_BACKENDS:
+            if backend != "files":
+                start = time.perf_counter()
+                shop.import_storage(shop.open_storage("files", database_dir), shop.open_storage(backend, database_dir))
+                print(f"imported into {backend} in {time.perf_counter() - start:.1f}s")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # Store methods print to the console
+            for backend in shop.STORAGE_BACKENDS:
+                rng = random.Random(args.seed)
+                storage = shop.open_storage(backend, database_dir)
+                user_ops = shop.UserOperations(database_dir, hasher=shop.PasswordHasher(args.scrypt_n, workers=0), storage=storage)
+                store = shop.StoreOperations("Bench Store", database_dir, hold_ttl=3600, storage=storage)
+                usernames = list(user_ops.users)
+                products = list(store.products)
+                buyers = [username for username in usernames[:1000] if storage.count_purchase_history(username)]
+                shopper = user_ops.authenticate(usernames[0], "password123")
+                store.attach_cart(shopper)
+                operations = {
+                    "login": run_operation(lambda i: user_ops.authenticate(rng.choice(usernames), "password123"), args.login_samples),
+                    "checkout": run_operation(
+                        lambda i: store.checkout("street, landmark, city, state", shopper, "cod", feedback=""), args.samples,
+                        setup=lambda i: shopper.cart.add_many((rng.choice(products), 1) for _ in range(3)),
+                    ),
+                    "count_purchase_history": run_operation(lambda i: storage.count_purchase_history(rng.choice(buyers)), args.samples),
+                    "load_purchase_history": run_operation(lambda i: storage.load_purchase_history(rng.choice(buyers)), args.samples),
+                    "load_purchase_history_newest_10": run_operation(lambda i: storage.load_purchase_history(rng.choice(buyers), limit=10), args.samples),
+                }
+                rows.extend((backend, name, result) for name, result in operations.items())
+                store.catalog.close()
+                storage.close()
+    print(f"{args.users} users, {args.products} products, {args.orders} orders")
+    print(f"{'backend':<9}{'operation':<34}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for backend, name, result in rows:
+        print(f"{backend:<9}{name:<34}{result['ops_per_sec']:>12,.1f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}")
+
+
+# "Also bought" recommendations: bulk rebuild from stored orders, incremental updates and query latency
+def bench_recommendations(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as database_dir:
+        generate_dataset(database_dir, args.users, args.products, args.orders, args.seed, args.scrypt_n)
+        files = shop.FileManagement(database_dir)
+        purchases = list(files.iter_all_purchases())
+        files.close()
+    start = time.perf_counter()
+    engine = shop.RecommendationEngine(args.top_k).ingest(purchases)
+    print(f"rebuilt from {len(purchases)} orders in {time.perf_counter() - start:.2f}s: {len(engine.pairs)} products, "
+          f"{sum(len(row) for row in engine.pairs.values())} pairs")
+    titles = list(engine.titles)
+    operations = {
+        "record_purchase": run_operation(lambda i: engine.record_purchase(rng.choice(purchases)), args.samples),
+        "also_bought": run_operation(lambda i: engine.also_bought(rng.choice(titles)), args.samples),
+        "for_cart_3_items": run_operation(lambda i: engine.for_cart(rng.sample(titles, 3)), args.samples),
+        "for_cart_10_items": run_operation(lambda i: engine.for_cart(rng.sample(titles, 10)), args.samples),
+    }
+    print(f"{'operation':<34}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, result in operations.items():
+        print(f"{name:<34}{result['ops_per_sec']:>12,.1f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}")
+
+
+def bench_compare(args):
+    # Side-by-side of two suite result files; ratios above 1 are regressions for latency and memory
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"{baseline['meta']['commit']} -> {candidate['meta']['commit']}")
+    print(f"{'operation':<34}{'ops/s':>10}{'p50':>8}{'p99':>8}{'peak':>8}")
+    for name, new in candidate["operations"].items():
+        old = baseline["operations"].get(name)
+        if old is None:
+            print(f"{name:<34}{'(new)':>10}")
+            continue
+        ratio = lambda key: new[key] / old[key] if old[key] else float("nan")
+        print(f"{name:<34}{ratio('ops_per_sec'):>9.2f}x{ratio('p50_ms'):>7.2f}x{ratio('p99_ms'):>7.2f}x{ratio('peak_kib'):>7.2f}x")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# HTTP load generator for `main-code.py --serve`
+class LoadClient:
+    def __init__(self, host, port, latencies, statuses):
+        self.host = host
+        self.port = port
+        self.latencies = latencies  # route -> [seconds]
+        self.statuses = statuses  # status -> count
+        self.token = ""
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, body=None, route=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        start = time.perf_counter()
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nAuthorization: Bearer {self.token}\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+        payload = json.loads(await self.reader.readexactly(length))
+        self.latencies.setdefault(route or path, []).append(time.perf_counter() - start)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status, payload
+
+
+async def run_load(args, latencies, statuses):
+    titles = ["Hoodie", "T-shirt", "Cap", "Rings", "Earrings", "Bandana"]
+
+    async def customer(n):
+        client = LoadClient(args.host, args.port, latencies, statuses)
+        await client.connect()
+        username = f"load{os.getpid()}x{n}"
+        await client.request("POST", "/signup", {"first_name": "Load", "last_name": "Test", "username": username, "password": "password123"})
+        _, session = await client.request("POST", "/login", {"username": username, "password": "password123"})
+        client.token = session.get("token", "")
+        for i in range(args.requests):
+            step = i % 6
+            if step == 0:
+                await client.request("GET", f"/products?prefix={random.choice(titles)[:2]}", route="/products")
+            elif step == 1:
+                await client.request("POST", "/cart/add", {"title": random.choice(titles), "quantity": 1})
+            elif step == 2:
+                await client.request("GET", "/cart")
+            elif step == 3:
+                _, cart = await client.request("GET", "/cart")
+                for item in cart.get("items", [])[:1]:
+                    await client.request("POST", "/cart/remove", {"title": item["title"], "quantity": 1})
+            elif step == 4 and i % (6 * args.checkout_every) == 4:
+                await client.request("POST", "/cart/add", {"title": random.choice(titles), "quantity": 1})
+                await client.request("POST", "/checkout", {"address": "street, landmark, city, state", "payment": "cod"})
+            else:
+                await client.request("GET", "/history?limit=5", route="/history")
+        client.writer.close()
+
+    await asyncio.gather(*(customer(n) for n in range(args.clients)))
+
+
+def bench_loadgen(args):
+    server = None
+    temp_dir = None
+    latencies, statuses = {}, {}
+    try:
+        if args.spawn:
+            # Run a throwaway server against an empty database
+            temp_dir = tempfile.TemporaryDirectory()
+            server = subprocess.Popen([sys.executable, shop.__file__, "--serve", "--port", str(args.port), "--database-dir", temp_dir.name])
+            for _ in range(100):
+                if server.poll() is not None:
+                    raise SystemExit("The spawned server exited; is the port already in use?")
+                try:
+                    socket.create_connection((args.host, args.port)).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        start = time.perf_counter()
+        asyncio.run(run_load(args, latencies, statuses))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{args.clients} clients, {total} requests in {elapsed:.2f}s -> {total / elapsed:,.0f} req/s  statuses={statuses}")
+    print(f"{'route':<16}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    everything = []
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        everything.extend(values)
+        print(f"{route:<16}{len(values):>8}{percentile(values, 0.5) * 1000:>10.2f}{percentile(values, 0.9) * 1000:>10.2f}{percentile(values, 0.99) * 1000:>10.2f}")
+    everything.sort()
+    print(f"{'all':<16}{total:>8}{percentile(everything, 0.5) * 1000:>10.2f}{percentile(everything, 0.9) * 1000:>10.2f}{percentile(everything, 0.99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the Super Store hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    codecs = commands.add_parser("codecs", help="load time and peak memory per record format")
+    codecs.add_argument("--records", type=int, default=100000)
+    codecs.set_defaults(run=bench_codecs)
+
+    inventory = commands.add_parser("inventory", help="stress the reservation engine on one hot SKU")
+    inventory.add_argument("--threads", type=int, default=32)
+    inventory.add_argument("--attempts", type=int, default=2000)
+    inventory.add_argument("--stock", type=int, default=10000)
+    inventory.add_argument("--ttl", type=float, default=0.5)
+    inventory.set_defaults(run=bench_inventory)
+
+    checkouts = commands.add_parser("checkouts", help="purchase-history writes per order, direct vs group commit")
+    checkouts.add_argument("--threads", type=int, default=32)
+    checkouts.add_argument("--orders", type=int, default=20000)
+    checkouts.add_argument("--users", type=int, default=50)
+    checkouts.set_defaults(run=bench_checkouts)
+
+    catalog = commands.add_parser("catalog", help="memory and iteration time per product catalog layout")
+    catalog.add_argument("--products", type=int, default=200000)
+    catalog.set_defaults(run=bench_catalog)
+
+    sessions = commands.add_parser("sessions", help="memory held per concurrent shopper with the session LRU")
+    sessions.add_argument("--shoppers", type=int, nargs="+", default=[1000, 4000, 16000])
+    sessions.add_argument("--capacity", type=int, default=1000)
+    sessions.set_defaults(run=bench_sessions)
+
+    logins = commands.add_parser("logins", help="logins per second against password-hashing processes")
+    logins.add_argument("--users", type=int, default=50)
+    logins.add_argument("--logins", type=int, default=400)
+    logins.add_argument("--threads", type=int, default=16)
+    logins.add_argument("--scrypt-n", type=int, default=2**14)
+    logins.set_defaults(run=bench_logins)
+
+    loadgen = commands.add_parser("loadgen", help="drive the HTTP/JSON service and report req/s and latency percentiles")
+    loadgen.add_argument("--host", default="127.0.0.1")
+    loadgen.add_argument("--port", type=int, default=8080)
+    loadgen.add_argument("--spawn", action="store_true", help="start a server on a temporary database first")
+    loadgen.add_argument("--clients", type=int, default=50)
+    loadgen.add_argument("--requests", type=int, default=200, help="requests per client after login")
+    loadgen.add_argument("--checkout-every", type=int, default=5, help="check out on every Nth cycle of the request mix")
+    loadgen.set_defaults(run=bench_loadgen)
+
+    generate = commands.add_parser("generate", help="write a synthetic database/ of the given size")
+    generate.add_argument("--out", required=True)
+    generate.add_argument("--users", type=int, default=10000)
+    generate.add_argument("--products", type=int, default=1000)
+    generate.add_argument("--orders", type=int, default=50000)
+    generate.add_argument("--seed", type=int, default=1)
+    generate.add_argument("--scrypt-n", type=int, default=2**14)
+    generate.set_defaults(run=bench_generate)
+
+    suite = commands.add_parser("suite", help="throughput, p50/p99 latency and peak memory of the hot paths, saved as JSON")
+    suite.add_argument("--database-dir", help="use a generated dataset instead of generating a temporary one (checkouts are written to it)")
+    suite.add_argument("--users", type=int, default=10000)
+    suite.add_argument("--products", type=int, default=1000)
+    suite.add_argument("--orders", type=int, default=50000)
+    suite.add_argument("--seed", type=int, default=1)
+    suite.add_argument("--scrypt-n", type=int, default=2**14)
+    suite.add_argument("--samples", type=int, default=500)
+    suite.add_argument("--login-samples", type=int, default=50)
+    suite.add_argument("--repeats", type=int, default=3, help="runs of the whole-file loads")
+    suite.add_argument("--json", help="output path (default bench_results/<commit>.json)")
+    suite.set_defaults(run=bench_suite)
+
+    backends = commands.add_parser("backends", help="login, checkout and history queries on each storage backend")
+    backends.add_argument("--users", type=int, default=10000)
+    backends.add_argument("--products", type=int, default=1000)
+    backends.add_argument("--orders", type=int, default=50000)
+    backends.add_argument("--seed", type=int, default=1)
+    backends.add_argument("--scrypt-n", type=int, default=2**10, help="kept low so login measures storage, not hashing")
+    backends.add_argument("--samples", type=int, default=500)
+    backends.add_argument("--login-samples", type=int, default=200)
+    backends.set_defaults(run=bench_backends)
+
+    recommendations = commands.add_parser("recommendations", help="rebuild time, update rate and query latency of also-bought suggestions")
+    recommendations.add_argument("--users", type=int, default=10000)
+    recommendations.add_argument("--products", type=int, default=1000)
+    recommendations.add_argument("--orders", type=int, default=50000)
+    recommendations.add_argument("--seed", type=int, default=1)
+    recommendations.add_argument("--scrypt-n", type=int, default=2**10)
+    recommendations.add_argument("--top-k", type=int, default=10)
+    recommendations.add_argument("--samples", type=int, default=5000)
+    recommendations.set_defaults(run=bench_recommendations)
+
+    compare = commands.add_parser("compare", help="compare two suite result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(run=bench_compare)
+
+    args = parser.parse_args()
+    args.run(args)
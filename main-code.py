@@ -1,10 +1,190 @@
 import os
+import ast
+import argparse
+import asyncio
+import secrets
+import contextlib
+import urllib.parse
+import json
+import sqlite3
+import struct
 import hashlib
+import hmac
+import threading
+import queue
+import atexit
+import collections
+import concurrent.futures
+import multiprocessing
+import bisect
+import heapq
+import time
+import mmap
+import array
+import io
+import random
+import signal
+import cProfile
+import pstats
+import functools
+import itertools
+import tracemalloc
 from datetime import datetime
 from abc import ABC, abstractmethod
 
+try:
+    import numpy  # Optional: vectorizes the sales analytics queries
+except ImportError:
+    numpy = None
+
+PURCHASE_DATE_FORMAT = "%d-%m-%Y \t%H:%M:%S"  # How checkout stamps purchase records
+
+# Metrics class (counters and latency histograms for the store's I/O and operations; near-zero cost while disabled)
+class Metrics:
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # Seconds
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = collections.Counter()  # event -> count
+        self.histograms = {}  # operation -> [count per bucket..., +Inf count, total seconds]
+        self.errors = collections.Counter()  # operation -> calls that raised
+        self.profile_rate = 0.0  # Fraction of instrumented calls run under cProfile
+        self.profile_stats = None
+        self._profiling = threading.local()
+        self._profile_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def enable(self, profile_rate=0.0, trace_memory=False):
+        self.enabled = True
+        self.profile_rate = profile_rate
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def increment(self, event, value=1):
+        with self._lock:
+            self.counters[event] += value
+
+    def observe(self, operation, seconds):
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, operation):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.errors[operation] += 1
+            raise
+        finally:
+            self.observe(operation, time.perf_counter() - start)
+
+    def call(self, operation, fn, args, kwargs):
+        profiler = None
+        if self.profile_rate and not getattr(self._profiling, "active", False) and random.random() < self.profile_rate:
+            if self._profile_lock.acquire(blocking=False):  # One sampled call at a time across threads
+                profiler = cProfile.Profile()
+                self._profiling.active = True
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                return profiler.runcall(fn, *args, **kwargs)
+            return fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors[operation] += 1
+            raise
+        finally:
+            self.observe(operation, time.perf_counter() - start)
+            if profiler is not None:
+                self._profiling.active = False
+                if self.profile_stats is None:
+                    self.profile_stats = pstats.Stats(profiler)
+                else:
+                    self.profile_stats.add(profiler)
+                self._profile_lock.release()
+
+    def profile_report(self, top=20):
+        # Text report of the sampled cProfile calls and, if tracing, the largest allocation sites
+        report = io.StringIO()
+        if self.profile_stats is not None:
+            with self._profile_lock:
+                self.profile_stats.stream = report
+                self.profile_stats.sort_stats("cumulative").print_stats(top)
+        if tracemalloc.is_tracing():
+            report.write("Top allocation sites:\n")
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:top]:
+                report.write(f"  {stat}\n")
+        return report.getvalue()
+
+    def to_json(self):
+        with self._lock:
+            operations = {}
+            for operation, histogram in self.histograms.items():
+                count = sum(histogram[:-1])
+                operations[operation] = {
+                    "count": count,
+                    "errors": self.errors.get(operation, 0),
+                    "total_seconds": histogram[-1],
+                    "mean_seconds": histogram[-1] / count if count else 0.0,
+                    "buckets": {str(bound): n for bound, n in zip(self.BUCKETS + ("+Inf",), itertools.accumulate(histogram[:-1]))},
+                }
+            return {"counters": dict(self.counters), "operations": operations}
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = ["# TYPE shop_events_total counter"]
+            for event, count in sorted(self.counters.items()):
+                lines.append(f'shop_events_total{{event="{event}"}} {count}')
+            lines.append("# TYPE shop_operation_errors_total counter")
+            for operation, count in sorted(self.errors.items()):
+                lines.append(f'shop_operation_errors_total{{operation="{operation}"}} {count}')
+            lines.append("# TYPE shop_operation_seconds histogram")
+            for operation, histogram in sorted(self.histograms.items()):
+                for bound, cumulative in zip(self.BUCKETS + ("+Inf",), itertools.accumulate(histogram[:-1])):
+                    lines.append(f'shop_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+                lines.append(f'shop_operation_seconds_sum{{operation="{operation}"}} {histogram[-1]}')
+                lines.append(f'shop_operation_seconds_count{{operation="{operation}"}} {sum(histogram[:-1])}')
+            return "\n".join(lines) + "\n"
+
+    def dump(self, filename):
+        # Prometheus text for .prom/.txt files, JSON otherwise
+        with open(filename, 'w') as f:
+            if filename.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+
+METRICS = Metrics()  # Process-wide registry; enabled with --metrics or SHOP_METRICS=1
+
+def instrumented(operation):
+    # Decorator: times the call into METRICS when enabled, otherwise just one flag check
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            return METRICS.call(operation, fn, args, kwargs)
+        return wrapper
+    return decorate
+
 # Abstract class (LibraryItem)
 class LibraryItem(ABC):
+    __slots__ = ("title", "price")  # No per-instance __dict__; catalogs can hold millions of these
+
     def __init__(self, title, price):
         self.title = title
         self.price = price
@@ -15,6 +195,8 @@ class LibraryItem(ABC):
 
 # Product class (inherits from LibraryItem)
 class Product(LibraryItem):
+    __slots__ = ("stock_quantity",)
+
     def __init__(self, title, price, stock_quantity):
         super().__init__(title, price)
         self.stock_quantity = stock_quantity
@@ -28,6 +210,13 @@ class Product(LibraryItem):
         if self.stock_quantity < 0:
             self.stock_quantity = 0  # Ensure stock doesn't go negative
 
+    def hold_stock(self, quantity):
+        # Set units aside for a cart (a negative quantity gives them back) until they are sold
+        self.update_stock(-quantity)
+
+    def sell_held_stock(self, quantity):
+        pass  # The units already left stock when they were held
+
     def __str__(self):
         return f"{self.title}, Rs.{self.price}, Stock: {self.stock_quantity}"
 
@@ -44,20 +233,57 @@ class User:
             "username": self.username,
             "password": self.password  # Store the hashed password
         }
-        self.cart = Cart()
-        self.purchase_history = [] # Initialize purchase history
+        self._cart = None  # Created on first use; most loaded accounts never shop in this process
+        self.history_loader = None  # Set at login; history is read from disk on first use
+        self._purchase_history = None
+
+    @property
+    def cart(self):
+        if self._cart is None:
+            self._cart = Cart()
+        return self._cart
+
+    @cart.setter
+    def cart(self, cart):
+        self._cart = cart
+
+    def detach_cart(self):
+        # Hand back the in-memory cart (or None) and forget loaded history; both are rebuilt on next use
+        cart, self._cart, self._purchase_history = self._cart, None, None
+        return cart
+
+    @property
+    def purchase_history(self):
+        if self._purchase_history is None:
+            self._purchase_history = self.history_loader(self.username) if self.history_loader else []
+        return self._purchase_history
+
+    @purchase_history.setter
+    def purchase_history(self, history):
+        self._purchase_history = history
 
     def add_purchase_history(self, purchase_record):
-        self.purchase_history.append(purchase_record)
-
-    def view_purchase_history(self,file_manager):
-        user_history = file_manager.load_purchase_history(self.username)  # Load purchase history for the current user
-        if user_history:
-            for purchase in user_history:
-                print(f"-------------------------------\nDate: {purchase['date']}, Total Bill: Rs.{purchase['total_bill']}")
-                for item in purchase["items"]:
-                    print(f"{item['title']} - Rs.{item['price']} x {item['quantity']}")
-                print(f"Shipping Address: {purchase['address']}")
+        if self._purchase_history is not None or self.history_loader is None:
+            self.purchase_history.append(purchase_record)  # Otherwise it is picked up from disk when first viewed
+
+    def view_purchase_history(self, storage, page_size=10):
+        # Show the newest orders a page at a time; older pages are only read if asked for
+        total = storage.count_purchase_history(self.username)
+        shown = 0
+        if total:
+            while shown < total:
+                user_history = storage.load_purchase_history(self.username, limit=page_size, offset=shown)
+                for purchase in reversed(user_history):
+                    print(f"-------------------------------\nDate: {purchase['date']}, Total Bill: Rs.{purchase['total_bill']}")
+                    for item in purchase["items"]:
+                        print(f"{item['title']} - Rs.{item['price']} x {item['quantity']}")
+                    print(f"Shipping Address: {purchase['address']}")
+                shown += len(user_history)
+                if not user_history or shown >= total:
+                    break
+                more = input(f"\nShowing {shown} of {total} orders. View older orders (yes/no)?: ").lower().strip()
+                if more != 'yes':
+                    break
         else:
             print("\n-------------------------------")
             print_red("User has no Previous Shopping History\n")
@@ -69,120 +295,2431 @@ class Customer(User):
 
 # Cart class
 class Cart:
-    def __init__(self):
-        self.items = []
+    def __init__(self, inventory=None):
+        self.inventory = inventory  # InventoryEngine holding this cart's stock, if any
+        self.lines = {}  # lowercased title -> {"title", "price", "quantity"}; one line per product
+        self.products = {}  # lowercased title -> Product, for returning stock
+        self.subtotal = 0  # Running total, updated on every change
+        self.item_count = 0  # Running number of units in the cart
+        self.recommender = None  # Callable(titles) -> [(title, orders together)], set by the store
+        self._lock = threading.RLock()  # The reaper thread may expire lines concurrently
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def items(self):
+        return list(self.lines.values())
 
     def add_to_cart(self, product, quantity):
-        if product.stock_quantity >= quantity:
-            self.items.append({"title": product.title, "price": product.price, "quantity": quantity})
-            product.update_stock(-quantity)
-            print_green(f"Added {quantity} Quantity of {product.title} to the cart.\n")
-        else:
-            print_red(f"Insufficient stock for {product.title}. Available quantity: {product.stock_quantity}")
-            print("-------------------------------")
+        if quantity <= 0:
+            print_red("Quantity to add must be positive.")
+            return 0  # A negative hold would put stock back that was never taken; a zero one leaves an empty line
+        with self._lock:
+            if self.inventory is not None:
+                reserved = self.inventory.reserve(self, product, quantity)
+            elif product.stock_quantity >= quantity:
+                product.update_stock(-quantity)
+                reserved = True
+            else:
+                reserved = False
+            if reserved:
+                key = product.title.lower()
+                line = self.lines.get(key)
+                if line is None:
+                    self.lines[key] = {"title": product.title, "price": product.price, "quantity": quantity}
+                    self.products[key] = product
+                else:
+                    line["quantity"] += quantity  # Merge repeat adds into the existing line
+                self.subtotal += product.price * quantity
+                self.item_count += quantity
+                print_green(f"Added {quantity} Quantity of {product.title} to the cart.\n")
+                return quantity
+        print_red(f"Insufficient stock for {product.title}. Available quantity: {product.stock_quantity}")
+        print("-------------------------------")
+        return 0
+
+    def add_many(self, line_items):
+        # Apply several (product, quantity) pairs in one call; returns the quantity added for each
+        return [self.add_to_cart(product, quantity) for product, quantity in line_items]
 
     def remove_from_cart(self, product_title, quantity):
-        for item in self.items[:]:
-            if item["title"].lower() == product_title.lower():
-                if quantity <= item["quantity"]:
-                    item["quantity"] -= quantity
-                    if item["quantity"] == 0:
-                        self.items.remove(item)
-                    print_green(f"Removed {quantity} Quantity of {product_title} from the cart.\n")
-                    return quantity  # Return the quantity removed
-                else:
-                    print_red(f"Quantity {quantity} exceeds the available quantity in the cart for {product_title}.")
-                    return 0  # Indicate no items were removed
-        print_red(f"{product_title} not found in the cart.\n")
-        return 0  # Indicate no items were removed
+        # Removed units go straight back to the product's stock
+        key = product_title.strip().lower()
+        if quantity <= 0:
+            print_red("Quantity to remove must be positive.")
+            return 0  # A negative removal would grow the line and its hold past the reserved stock
+        with self._lock:
+            line = self.lines.get(key)
+            if line is None:
+                print_red(f"{product_title} not found in the cart.\n")
+                return 0  # Indicate no items were removed
+            if quantity > line["quantity"]:
+                print_red(f"Quantity {quantity} exceeds the available quantity in the cart for {product_title}.")
+                return 0  # Indicate no items were removed
+            if self.inventory is not None:
+                self.inventory.release(self, key, quantity)
+            else:
+                self.products[key].update_stock(quantity)
+            self._drop(key, quantity)
+        print_green(f"Removed {quantity} Quantity of {product_title} from the cart.\n")
+        return quantity  # Return the quantity removed
+
+    def remove_many(self, line_items):
+        # Apply several (product title, quantity) pairs in one call; returns the quantity removed for each
+        return [self.remove_from_cart(product_title, quantity) for product_title, quantity in line_items]
+
+    def expire_line(self, key, quantity):
+        # Called by the inventory reaper after it has returned an expired hold to stock
+        with self._lock:
+            line = self.lines.get(key)
+            if line is not None:
+                self._drop(key, min(quantity, line["quantity"]))
+
+    def _drop(self, key, quantity):
+        line = self.lines[key]
+        line["quantity"] -= quantity
+        self.subtotal -= line["price"] * quantity
+        self.item_count -= quantity
+        if line["quantity"] == 0:
+            del self.lines[key]
+            del self.products[key]
+
+    def checkout_snapshot(self):
+        # Hand the current lines and totals over to checkout and start a fresh cart, without copying or re-summing
+        with self._lock:
+            if self.inventory is not None:
+                # Only sell what is still held; a hold can expire between the last add and checkout
+                for key, held in self.inventory.commit(self, list(self.lines)).items():
+                    if held < self.lines[key]["quantity"]:
+                        self._drop(key, self.lines[key]["quantity"] - held)
+            lines, subtotal, item_count = self.lines, self.subtotal, self.item_count
+            self.lines = {}
+            self.products = {}
+            self.subtotal = 0
+            self.item_count = 0
+        return list(lines.values()), subtotal, item_count
 
     def view_cart(self):
-        if self.items:
-            total_price = sum(item["price"] * item["quantity"] for item in self.items)
-            for item in self.items:
+        if self.lines:
+            for item in self.lines.values():
                 print(f"{item['title']} - Rs.{item['price']} x {item['quantity']}")
-            print(f"Total Price: Rs.{total_price}\n")
+            print(f"Total Price: Rs.{self.subtotal}\n")
+            if self.recommender is not None:
+                suggestions = self.recommender([item["title"] for item in self.lines.values()])
+                if suggestions:
+                    print("Customers who bought these also bought: " + ", ".join(title for title, _ in suggestions) + "\n")
         else:
             print_red("Your cart is empty.")
             print("-------------------------------")
 
-# FileManagement class
-class FileManagement:
+# InventoryEngine class (atomic reserve/commit/release of stock with expiring cart holds)
+class InventoryEngine:
+    def __init__(self, hold_ttl=900, reap_interval=5):
+        self.hold_ttl = hold_ttl  # Seconds a cart may hold stock without checking out
+        self.reap_interval = reap_interval
+        self._locks = {}  # lowercased title -> Lock, one per SKU
+        self._locks_guard = threading.Lock()
+        self._holds = {}  # (cart, lowercased title) -> [product, quantity, expires_at]
+        self._expiry = []  # Heap of (expires_at, sequence, cart, lowercased title); stale entries are skipped
+        self._sequence = 0
+        self._holds_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def lock_for(self, product):
+        key = product.title.lower()
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._locks_guard:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+
+    def reserve(self, cart, product, quantity):
+        # Check and take the stock under the SKU lock so concurrent carts can't oversell
+        if quantity <= 0:
+            raise ValueError("Quantity to reserve must be positive.")
+        with self.lock_for(product):
+            if product.stock_quantity < quantity:
+                return False
+            product.hold_stock(quantity)
+        key = product.title.lower()
+        expires_at = time.monotonic() + self.hold_ttl
+        with self._holds_lock:
+            hold = self._holds.get((cart, key))
+            if hold is None:
+                self._holds[(cart, key)] = [product, quantity, expires_at]
+            else:
+                hold[1] += quantity
+                hold[2] = expires_at  # Touching a hold renews it
+            self._sequence += 1
+            heapq.heappush(self._expiry, (expires_at, self._sequence, cart, key))
+        return True
+
+    def release(self, cart, product_title, quantity=None):
+        # Put held stock back; returns how much was actually released (it may have expired meanwhile)
+        key = product_title.strip().lower()
+        with self._holds_lock:
+            hold = self._holds.get((cart, key))
+            if hold is None:
+                return 0
+            product = hold[0]
+            quantity = hold[1] if quantity is None else min(quantity, hold[1])
+            hold[1] -= quantity
+            if hold[1] == 0:
+                del self._holds[(cart, key)]
+                self._compact_expiry()
+        with self.lock_for(product):
+            product.hold_stock(-quantity)
+        return quantity
+
+    def commit(self, cart, keys):
+        # Turn the cart's holds into a sale; returns {lowercased title: quantity still held}
+        committed = {}
+        sold = []
+        with self._holds_lock:
+            for key in keys:
+                hold = self._holds.pop((cart, key), None)
+                committed[key] = hold[1] if hold else 0
+                if hold:
+                    sold.append(hold)
+            self._compact_expiry()
+        for product, quantity, _ in sold:
+            with self.lock_for(product):
+                product.sell_held_stock(quantity)
+        return committed
+
+    def _compact_expiry(self):
+        # Stale heap entries keep released carts alive until their TTL; rebuild once they outnumber live holds
+        if len(self._expiry) > 2 * len(self._holds) + 64:
+            self._expiry = [(hold[2], sequence, cart, key) for sequence, ((cart, key), hold) in enumerate(self._holds.items(), self._sequence + 1)]
+            self._sequence += len(self._expiry)
+            heapq.heapify(self._expiry)
+
+    def reap(self, now=None):
+        # Release every hold whose TTL has passed and drop it from its cart
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._holds_lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, _, cart, key = heapq.heappop(self._expiry)
+                hold = self._holds.get((cart, key))
+                if hold is not None and hold[2] == expires_at:
+                    del self._holds[(cart, key)]
+                    expired.append((cart, key, hold[0], hold[1]))
+        for cart, key, product, quantity in expired:
+            with self.lock_for(product):
+                product.hold_stock(-quantity)
+            cart.expire_line(key, quantity)
+        return len(expired)
+
+    def start_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            self.reap()
+
+    def stop(self):
+        self._stop.set()
+
+# Record codecs (how a single record is laid out on disk)
+class RecordCodec(ABC):
+    name = None
+    header = b""  # Written once at the start of every new file
+
+    @abstractmethod
+    def encode(self, record):
+        pass
+
+    @abstractmethod
+    def iter_decode(self, f):
+        # Yields (offset, record) for each record in a binary file positioned just after the header
+        pass
+
+    @abstractmethod
+    def whole_records_end(self, f, size):
+        # Offset just past the last complete record, so a torn tail left by a crash can be cut off
+        pass
+
+# JSON Lines codec (default): one compact JSON object per line
+class JsonLinesCodec(RecordCodec):
+    name = "jsonl"
+
+    def encode(self, record):
+        return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+    def iter_decode(self, f):
+        offset = f.tell()
+        for line in f:
+            if not line.endswith(b"\n"):
+                try:
+                    record = json.loads(line) if line.strip() else None
+                except ValueError:
+                    return  # Torn final record from a crash
+                if record is not None:
+                    yield offset, record
+                return
+            if line.strip():
+                if line.startswith(b"{'"):
+                    # Legacy repr() line from before the codec existed; parsed as a literal, never executed
+                    yield offset, ast.literal_eval(line.decode())
+                else:
+                    yield offset, json.loads(line)
+            offset += len(line)
+
+    def whole_records_end(self, f, size):
+        # Every record ends in a newline, so the last one bounds the whole records
+        end = size
+        while end > len(self.header):
+            start = max(len(self.header), end - 4096)
+            f.seek(start)
+            chunk = f.read(end - start)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+        return len(self.header)
+
+# Binary codec: versioned header, then length-prefixed records with a small tagged encoding
+class BinaryCodec(RecordCodec):
+    name = "binary"
+    MAGIC = b"SHOPREC"
+    SCHEMA_VERSION = 1
+    header = MAGIC + bytes([SCHEMA_VERSION])
+    _LENGTH = struct.Struct("<I")
+    _INT32 = struct.Struct("<i")
+    _INT = struct.Struct("<q")
+    _FLOAT = struct.Struct("<d")
+
+    def encode(self, record):
+        payload = bytearray()
+        self._encode_value(record, payload)
+        return self._LENGTH.pack(len(payload)) + payload
+
+    def _encode_value(self, value, out):
+        if value is None:
+            out += b"N"
+        elif value is True:
+            out += b"T"
+        elif value is False:
+            out += b"F"
+        elif isinstance(value, int):
+            if -2**31 <= value < 2**31:
+                out += b"i" + self._INT32.pack(value)
+            else:
+                out += b"q" + self._INT.pack(value)
+        elif isinstance(value, float):
+            out += b"d" + self._FLOAT.pack(value)
+        elif isinstance(value, str):
+            data = value.encode()
+            if len(data) < 256:
+                out += b"s" + bytes([len(data)]) + data  # Short strings (titles, keys) get a one-byte length
+            else:
+                out += b"S" + self._LENGTH.pack(len(data)) + data
+        elif isinstance(value, (list, tuple)):
+            out += b"l" + self._LENGTH.pack(len(value))
+            for item in value:
+                self._encode_value(item, out)
+        elif isinstance(value, dict):
+            out += b"m" + self._LENGTH.pack(len(value))
+            for key, item in value.items():
+                self._encode_value(str(key), out)
+                self._encode_value(item, out)
+        else:
+            raise TypeError(f"Cannot encode value of type {type(value).__name__}")
+
+    def _decode_value(self, data, pos):
+        tag = data[pos:pos + 1]
+        pos += 1
+        if tag == b"N":
+            return None, pos
+        if tag == b"T":
+            return True, pos
+        if tag == b"F":
+            return False, pos
+        if tag == b"i":
+            return self._INT32.unpack_from(data, pos)[0], pos + 4
+        if tag == b"q":
+            return self._INT.unpack_from(data, pos)[0], pos + 8
+        if tag == b"d":
+            return self._FLOAT.unpack_from(data, pos)[0], pos + 8
+        if tag == b"s":
+            length = data[pos]
+            pos += 1
+            return data[pos:pos + length].decode(), pos + length
+        if tag == b"S":
+            length = self._LENGTH.unpack_from(data, pos)[0]
+            pos += 4
+            return data[pos:pos + length].decode(), pos + length
+        if tag == b"l":
+            count = self._LENGTH.unpack_from(data, pos)[0]
+            pos += 4
+            items = []
+            for _ in range(count):
+                item, pos = self._decode_value(data, pos)
+                items.append(item)
+            return items, pos
+        if tag == b"m":
+            count = self._LENGTH.unpack_from(data, pos)[0]
+            pos += 4
+            items = {}
+            for _ in range(count):
+                key, pos = self._decode_value(data, pos)
+                items[key], pos = self._decode_value(data, pos)
+            return items, pos
+        raise ValueError(f"Corrupt record: unknown tag {tag!r}")
+
+    def decode(self, payload):
+        return self._decode_value(payload, 0)[0]
+
+    def iter_decode(self, f):
+        offset = f.tell()
+        while True:
+            prefix = f.read(4)
+            if len(prefix) < 4:
+                return  # End of file (or a torn length prefix from a crash)
+            length = self._LENGTH.unpack(prefix)[0]
+            payload = f.read(length)
+            if len(payload) < length:
+                return  # Torn final record
+            yield offset, self.decode(payload)
+            offset += 4 + length
+
+    def whole_records_end(self, f, size):
+        # Walk the length prefixes without decoding payloads
+        offset = len(self.header)
+        while offset + 4 <= size:
+            f.seek(offset)
+            length = self._LENGTH.unpack(f.read(4))[0]
+            if offset + 4 + length > size:
+                break
+            offset += 4 + length
+        return offset
+
+RECORD_CODECS = {"jsonl": JsonLinesCodec, "binary": BinaryCodec}
+
+def purchase_timestamp(purchase_record):
+    # Seconds since the epoch for a purchase record's date, 0 if it can't be parsed
+    try:
+        return int(datetime.strptime(purchase_record["date"], PURCHASE_DATE_FORMAT).timestamp())
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+# PurchaseHistoryIndex class (fixed-width sidecar of record offsets for one history file)
+class PurchaseHistoryIndex:
+    # Layout: covered data-file size, then one (record offset, timestamp) entry per purchase
+    _HEADER = struct.Struct("<Q")
+    _ENTRY = struct.Struct("<Qq")
+    _locks = [threading.Lock() for _ in range(256)]  # Striped by file so one customer's catch-up doesn't stall other checkouts
+
+    def __init__(self, history_filename):
+        self.filename = os.path.splitext(history_filename)[0] + ".idx"
+        self.lock = self._locks[hash(self.filename) % len(self._locks)]  # Serializes appends and catch-ups so no record is indexed twice
+
+    def covered_size(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                header = f.read(self._HEADER.size)
+        except FileNotFoundError:
+            return 0
+        return self._HEADER.unpack(header)[0] if len(header) == self._HEADER.size else 0
+
+    def reset(self):
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def append(self, entries, covered_size):
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self._HEADER.size:
+                os.pwrite(fd, self._HEADER.pack(0), 0)
+            if entries:
+                # Write over any torn entry left by a crash, right after the last whole one
+                count = max(0, (os.fstat(fd).st_size - self._HEADER.size) // self._ENTRY.size)
+                data = b"".join(self._ENTRY.pack(offset, timestamp) for offset, timestamp in entries)
+                os.pwrite(fd, data, self._HEADER.size + count * self._ENTRY.size)
+            os.pwrite(fd, self._HEADER.pack(covered_size), 0)  # Header last, so it never claims unindexed records
+        finally:
+            os.close(fd)
+
+    def __len__(self):
+        try:
+            return max(0, (os.path.getsize(self.filename) - self._HEADER.size) // self._ENTRY.size)
+        except FileNotFoundError:
+            return 0
+
+    def entries(self):
+        # Every (record offset, timestamp) pair, oldest first
+        try:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        count = max(0, (len(data) - self._HEADER.size) // self._ENTRY.size)
+        return list(self._ENTRY.iter_unpack(data[self._HEADER.size:self._HEADER.size + count * self._ENTRY.size]))
+
+class _IndexColumn:
+    # Sequence view over one field of the fixed-width entries in a mapped index so bisect can search it in place
+    def __init__(self, view, count, base, entry, field):
+        self.view = view
+        self.count = count
+        self.base = base
+        self.entry = entry
+        self.field = field
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.entry.unpack_from(self.view, self.base + i * self.entry.size)[self.field]
+
+# OrderLog class (every customer's purchases in shared, size-rotated segment files, found through a per-user index)
+class OrderLog:
+    # Segments hold whole records back to back. The per-user index maps a username hash to (segment, offset,
+    # length, timestamp) entries: a sorted, memory-mapped index.dat written by compaction, plus a journal of
+    # entries appended since. Like the catalog snapshot, compaction folds the journal into a new index.dat.
+    SEGMENT_BYTES = 64 * 2**20  # Start a new segment once the active one reaches this size
+    COMPACT_ENTRIES = 100000  # Fold the journal into index.dat (in the background) after this many entries
+    MAGIC = b"SHOPORD"
+    VERSION = 1
+    _HEADER = struct.Struct("<7sBIQIQ")  # magic, version, last journal generation folded in, entry count, segment and size covered
+    _ENTRY = struct.Struct("<QIQIq")  # user key, segment, record offset, record length, timestamp
+    _open_logs = {}  # Directory -> OrderLog, so every FileManagement in the process shares one writer and index
+    _open_logs_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, file_manager):
+        directory = os.path.realpath(os.path.join(file_manager.database_dir, "orders"))
+        with cls._open_logs_lock:
+            log = cls._open_logs.get(directory)
+            if log is None:
+                log = cls._open_logs[directory] = cls(file_manager, directory)  # Closed by the storage backend that owns it
+        return log
+
+    def __init__(self, file_manager, directory):
+        self.file_manager = file_manager  # For codecs and torn-tail handling of the segment files
+        self.directory = directory
+        self.index_filename = os.path.join(directory, "index.dat")
+        os.makedirs(directory, exist_ok=True)  # Once per process, not per order
+        self._lock = threading.Lock()  # Serializes appends, rotation and the journal swap
+        self._compact_lock = threading.Lock()
+        self._compacting = False
+        # (index map, entry count, entries being compacted, entries journaled since): swapped as a whole so
+        # lock-free readers never see an entry twice or miss one mid-compaction
+        self._state = (None, 0, {}, {})
+        self._journal_fd = None
+        self._journal_entries = 0
+        self._file = None
+        self._codecs = {}  # Segment -> codec, sniffed once per sealed segment
+        self._closed = False
+        if os.path.exists(self.index_filename + ".tmp"):
+            os.remove(self.index_filename + ".tmp")  # Leftover from an interrupted compaction
+        generation, covered = self._map_index()
+        self._generation = self._replay_journals(generation)
+        self._journal_fd = os.open(self.journal_filename(self._generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+        self._file, self.codec = file_manager.open_for_append(self.segment_filename(self._segment))
+        self._segment_size = self._file.tell()
+        self._catch_up(covered)
+        if self._journal_entries >= self.COMPACT_ENTRIES:
+            self.compact_in_background()
+
+    @staticmethod
+    def user_key(username):
+        # 64-bit hash, so entries are fixed width; records carry the username for the rare collision
+        return int.from_bytes(hashlib.blake2b(username.encode(), digest_size=8).digest(), "little")
+
+    def segment_filename(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def journal_filename(self, generation):
+        return os.path.join(self.directory, f"index-{generation:06d}.journal")
+
+    def segments(self):
+        return sorted(int(name[8:-4]) for name in os.listdir(self.directory) if name.startswith("segment-") and name.endswith(".log"))
+
+    def _map_index(self):
+        # Returns (last journal generation folded in, (segment, size) covered by index.dat)
+        try:
+            with open(self.index_filename, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # ValueError: empty file
+            return 0, (0, 0)
+        magic, version, generation, count, segment, size = self._HEADER.unpack_from(mapped, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{self.index_filename} is not a version {self.VERSION} order index")
+        self._state = (mapped, count, {}, {})
+        return generation, (segment, size)
+
+    def _replay_journals(self, folded):
+        # Load the entries journaled since the last compaction; returns the generation to keep appending to
+        generations = sorted(int(name[6:-8]) for name in os.listdir(self.directory) if name.startswith("index-") and name.endswith(".journal"))
+        recent = self._state[3]
+        for generation in generations:
+            filename = self.journal_filename(generation)
+            if generation <= folded:
+                os.remove(filename)  # Already in index.dat; a compaction stopped before deleting it
+                continue
+            with open(filename, 'rb') as f:
+                data = f.read()
+            whole = len(data) - len(data) % self._ENTRY.size
+            if whole < len(data):
+                os.truncate(filename, whole)  # Torn entry from a crash
+            for key, segment, offset, length, timestamp in self._ENTRY.iter_unpack(data[:whole]):
+                recent.setdefault(key, []).append((segment, offset, length, timestamp))
+                self._journal_entries += 1
+        return max([folded + 1] + generations[-1:])
+
+    def _catch_up(self, covered):
+        # Index records that reached the active segment but not the journal before a crash
+        start = len(self.codec.header)
+        if covered[0] == self._segment:
+            start = max(start, covered[1])
+        for entries in self._state[3].values():
+            for segment, offset, length, _ in entries:
+                if segment == self._segment:
+                    start = max(start, offset + length)
+        if start >= self._segment_size:
+            return
+        purchases = []
+        with open(self.segment_filename(self._segment), 'rb') as f:
+            f.seek(start)
+            for _, record in self.codec.iter_decode(f):
+                purchases.append((record.get("username", ""), record))
+        # Drop the unindexed tail and append it again, so its entries are journaled like any other
+        self._file.truncate(start)
+        self._file.seek(start)
+        self._segment_size = start
+        self.append(purchases)
+
+    def append(self, purchases):
+        # purchases: (username, purchase record) pairs, written with one write and journaled with another
+        if not purchases:
+            return
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("OrderLog is closed.")
+            if self._segment_size >= self.SEGMENT_BYTES:
+                self._rotate()
+            position = self._segment_size
+            chunks = []
+            entries = []
+            for username, purchase_record in purchases:
+                data = self.codec.encode(purchase_record)
+                entries.append((self.user_key(username), self._segment, position, len(data), purchase_timestamp(purchase_record)))
+                chunks.append(data)
+                position += len(data)
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+            self._segment_size = position
+            # Journaled after the records are written, so the index never points past the segment's end
+            os.write(self._journal_fd, b"".join(self._ENTRY.pack(*entry) for entry in entries))
+            recent = self._state[3]
+            for key, segment, offset, length, timestamp in entries:
+                recent.setdefault(key, []).append((segment, offset, length, timestamp))
+            self._journal_entries += len(entries)
+            full = self._journal_entries >= self.COMPACT_ENTRIES
+        if full:
+            self.compact_in_background()
+
+    def _rotate(self):
+        # Both files are synced first: after a crash only the active segment may need catching up
+        os.fsync(self._file.fileno())
+        os.fsync(self._journal_fd)
+        self._file.close()
+        self._segment += 1
+        self._file, self.codec = self.file_manager.open_for_append(self.segment_filename(self._segment), self.file_manager.codec)
+        self._segment_size = self._file.tell()
+
+    def sync(self):
+        # The journal is not synced: anything it lost is re-indexed from the segment at the next start
+        with self._lock:
+            if self._closed:
+                return  # close() synced the segment, and nothing can be appended after it
+            os.fsync(self._file.fileno())
+
+    def entries(self, username):
+        # The user's (segment, offset, length, timestamp) entries, oldest first
+        key = self.user_key(username)
+        mapped, count, compacting, recent = self._state
+        entries = []
+        if mapped is not None:
+            keys = _IndexColumn(mapped, count, self._HEADER.size, self._ENTRY, 0)
+            low = bisect.bisect_left(keys, key)
+            high = bisect.bisect_right(keys, key, low)
+            entries = [self._ENTRY.unpack_from(mapped, self._HEADER.size + i * self._ENTRY.size)[1:] for i in range(low, high)]
+        entries.extend(compacting.get(key, ()))
+        entries.extend(recent.get(key, ()))
+        return entries
+
+    def read(self, entries):
+        # Yields the records behind (segment, offset, length) entries, one pread per run of adjacent records
+        runs = []
+        for segment, offset, length, *_ in entries:
+            if runs and runs[-1][0] == segment and runs[-1][1] + runs[-1][2] == offset:
+                runs[-1][2] += length
+            else:
+                runs.append([segment, offset, length])
+        fds = {}
+        try:
+            for segment, offset, length in runs:
+                fd = fds.get(segment)
+                if fd is None:
+                    fd = fds[segment] = os.open(self.segment_filename(segment), os.O_RDONLY)
+                codec = self._codecs.get(segment)
+                if codec is None:
+                    codec = self._codecs[segment] = self.file_manager.codec_for_file(self.segment_filename(segment))
+                for _, record in codec.iter_decode(io.BytesIO(os.pread(fd, length, offset))):
+                    yield record
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+
+    def mark(self):
+        # (segment, size) just past the last record written so far
+        with self._lock:
+            return self._segment, self._segment_size
+
+    def iter_records(self, until=None):
+        # Every stored purchase in the order it was written, stopping at a mark() if one is given
+        for segment in self.segments():
+            if until is not None and segment > until[0]:
+                return
+            for offset, record in self.file_manager.iter_records(self.segment_filename(segment), with_offsets=True):
+                if until is not None and segment == until[0] and offset >= until[1]:
+                    return
+                yield record
+
+    def compact_in_background(self):
+        with self._compact_lock:
+            if self._compacting or self._closed:
+                return None
+            self._compacting = True
+        thread = threading.Thread(target=self.compact, daemon=True)
+        thread.start()
+        return thread
+
+    @instrumented("orders.compact")
+    def compact(self):
+        # Merge the journaled entries into a new sorted index.dat, then drop the journal they came from
+        try:
+            with self._lock:
+                mapped, count, _, recent = self._state
+                if not recent or self._closed:
+                    return
+                # New entries go to a fresh journal; the frozen ones stay readable until the new index is mapped
+                generation = self._generation
+                os.fsync(self._journal_fd)
+                os.close(self._journal_fd)
+                self._generation += 1
+                self._journal_fd = os.open(self.journal_filename(self._generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self._journal_entries = 0
+                covered = (self._segment, self._segment_size)
+                self._state = (mapped, count, recent, {})
+            folded = sorted((key, *entry) for key, entries in recent.items() for entry in entries)
+            existing = self._ENTRY.iter_unpack(memoryview(mapped)[self._HEADER.size:self._HEADER.size + count * self._ENTRY.size]) if mapped is not None else ()
+            temp_filename = self.index_filename + ".tmp"
+            with open(temp_filename, 'wb') as f:
+                f.write(self._HEADER.pack(self.MAGIC, self.VERSION, generation, count + len(folded), *covered))
+                chunk = []
+                for entry in heapq.merge(existing, folded):
+                    chunk.append(self._ENTRY.pack(*entry))
+                    if len(chunk) >= 4096:
+                        f.write(b"".join(chunk))
+                        chunk = []
+                f.write(b"".join(chunk))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_filename, self.index_filename)
+            FileManagement.sync_directory(self.directory)
+            with open(self.index_filename, 'rb') as f:
+                new_mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with self._lock:
+                self._state = (new_mapped, count + len(folded), {}, self._state[3])
+            os.remove(self.journal_filename(generation))
+        finally:
+            with self._compact_lock:
+                self._compacting = False
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            os.fsync(self._file.fileno())
+            os.fsync(self._journal_fd)
+            os.close(self._journal_fd)
+            self._file.close()
+        with OrderLog._open_logs_lock:
+            if OrderLog._open_logs.get(self.directory) is self:
+                del OrderLog._open_logs[self.directory]
+
+# PurchaseWriter class (group commit: purchase records are queued and written in batches by one thread)
+class PurchaseWriter:
+    FSYNC_POLICIES = ("batch", "interval", "none")
+
+    def __init__(self, storage, fsync_policy="batch", fsync_interval=1.0, max_batch=512):
+        # fsync_policy: "batch" fsyncs before acknowledging (acknowledged orders survive a crash),
+        # "interval" fsyncs at most every fsync_interval seconds, "none" leaves it to the OS
+        if fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync_policy!r}; choose one of {', '.join(self.FSYNC_POLICIES)}.")
+        self.storage = storage  # StorageBackend the batches are appended to
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.max_batch = max_batch
+        self.batches = 0  # Stats for benchmarks
+        self.records_written = 0
+        self.fsyncs = 0
+        self._queue = queue.Queue()
+        self._unsynced = False  # Records written since the last fsync
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, username, purchase_record):
+        # Returns a Future that completes once the record is written (and fsynced under the "batch" policy)
+        future = concurrent.futures.Future()
+        self._check_running()
+        self._queue.put((username, purchase_record, future))
+        return future
+
+    def flush(self):
+        # Waits until everything submitted so far is written and synced
+        future = concurrent.futures.Future()
+        self._check_running()
+        self._queue.put((None, "flush", future))
+        future.result()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        future = concurrent.futures.Future()
+        self._queue.put((None, "close", future))
+        try:
+            future.result()  # Raises if the last batch could not be synced
+        finally:
+            self._thread.join()
+
+    def _check_running(self):
+        # Nothing would ever resolve a future queued behind a stopped thread
+        if self._closed:
+            raise RuntimeError("PurchaseWriter is closed.")
+        if not self._thread.is_alive():
+            raise RuntimeError("PurchaseWriter thread has stopped.")
+
+    def _run(self):
+        while True:
+            # Under the "interval" policy, wake up to sync pending writes even if no new orders arrive
+            timeout = self.fsync_interval if self.fsync_policy == "interval" and self._unsynced else None
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                try:
+                    self._sync()
+                except Exception:
+                    if METRICS.enabled:
+                        METRICS.increment("writer.sync_errors")  # Still unsynced, so the next batch tries again
+                continue
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                closing = self._write_batch(batch)
+            except Exception as e:
+                # A failed fsync: whatever this batch has not acknowledged fails with it, and the thread keeps serving
+                if METRICS.enabled:
+                    METRICS.increment("writer.sync_errors")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                closing = any(username is None and kind == "close" for username, kind, _ in batch)
+            if closing:
+                return
+
+    def _write_batch(self, batch):
+        with METRICS.timer("writer.write_batch"):
+            return self._write_grouped(batch)
+
+    def _write_grouped(self, batch):
+        purchases = []
+        futures = []
+        control = []
+        for username, record, future in batch:
+            if username is None:
+                control.append((record, future))
+            else:
+                purchases.append((username, record))
+                futures.append(future)
+        written = []
+        if purchases:
+            try:
+                self.storage.append_purchase_records(purchases)  # The whole batch is one append
+                self._unsynced = True
+                written = futures
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)  # The callers' checkouts see the failure; nothing is acknowledged
+        sync_all = bool(control) or self.fsync_policy == "batch"
+        if sync_all or (self.fsync_policy == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval):
+            self._sync()
+        self.batches += 1
+        self.records_written += len(written)
+        if METRICS.enabled:
+            METRICS.increment("writer.batches")
+            METRICS.increment("writer.records", len(written))
+        for future in written:
+            future.set_result(True)
+        closing = False
+        for kind, future in control:
+            closing = closing or kind == "close"
+            future.set_result(True)
+        return closing
+
+    def _sync(self):
+        if self.fsync_policy != "none" and self._unsynced:
+            self.storage.sync_purchases()
+            self.fsyncs += 1
+            if METRICS.enabled:
+                METRICS.increment("writer.fsyncs")
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+
+# StorageBackend class (where accounts, spilled carts, the catalog and purchase histories are kept)
+class StorageBackend(ABC):
+    name = None
+
     def __init__(self):
+        self.purchase_writer = None  # Optional PurchaseWriter for group-committed history appends
+
+    @abstractmethod
+    def load_users_data(self):
+        # Returns a username -> User index
+        pass
+
+    @abstractmethod
+    def save_user(self, user, users=None):
+        # Store one new or changed account
+        pass
+
+    @abstractmethod
+    def save_users_data(self, users):
+        # Replace every stored account (users: username -> User)
+        pass
+
+    @abstractmethod
+    def save_cart(self, username, items):
+        pass
+
+    @abstractmethod
+    def load_cart(self, username):
+        # The spilled cart lines, or [] if there are none
+        pass
+
+    @abstractmethod
+    def delete_cart(self, username):
+        pass
+
+    @abstractmethod
+    def catalog_snapshot(self):
+        # Persistence for ProductCatalog (see CatalogSnapshot for the interface)
+        pass
+
+    @abstractmethod
+    def append_purchase_records(self, purchases):
+        # purchases: (username, purchase record) pairs, stored together
+        pass
+
+    @abstractmethod
+    def sync_purchases(self):
+        # Make every appended purchase durable
+        pass
+
+    @abstractmethod
+    def load_purchase_history(self, username, limit=None, offset=0, since=None, until=None):
+        # Oldest first; limit/offset page backwards from the newest order, since/until (datetimes) restrict to a date range
+        pass
+
+    @abstractmethod
+    def count_purchase_history(self, username):
+        pass
+
+    @abstractmethod
+    def purchases_mark(self):
+        # High-water mark of the purchases stored so far, for iter_all_purchases(until=...)
+        pass
+
+    @abstractmethod
+    def iter_all_purchases(self, until=None):
+        # Every stored purchase record, oldest first; with until, only those stored before that purchases_mark()
+        pass
+
+    def close(self):
+        # The writer's last batch is written and synced before the backend closes what it writes to
+        if self.purchase_writer is not None:
+            self.purchase_writer.close()
+
+    @instrumented("storage.save_purchase_history")
+    def save_purchase_history(self, username, purchase_record, wait=True):
+        # With a purchase writer attached the record is group-committed; wait blocks until it is acknowledged
+        if self.purchase_writer is not None:
+            future = self.purchase_writer.submit(username, purchase_record)
+            return future.result() if wait else future
+        self.append_purchase_records([(username, purchase_record)])
+        return True
+
+# FileManagement class (the text-file backend: users log, catalog snapshot and the shared order log)
+class FileManagement(StorageBackend):
+    name = "files"
+
+    # Rewrite the users log once it holds this many more records than live accounts
+    USERS_COMPACT_MIN_RECORDS = 1024
+    _checked_tails = set()  # Files whose tail was checked for a torn record since this process opened them
+    _tails_lock = threading.Lock()
+
+    def __init__(self, database_dir="database", codec="jsonl"):
+        super().__init__()
+        self.database_dir = database_dir
+        self.codec = RECORD_CODECS[codec]()  # Codec used for new files; existing files keep their own
+        self.users_filename = os.path.join(self.database_dir, "users_data.txt")
+        self._users_lock = threading.Lock()  # Guards appends to the users log and the compaction swap
+        self._users_log_records = 0  # Number of records currently in the users log
+        self._users_compacting = None  # Records appended while a compaction is running
+        self._order_log = None  # Opened on first use; shared by every FileManagement on the same directory
         self.create_database_folder()  # Ensure database folder exists
 
     def create_database_folder(self):
         try:
-            os.mkdir('database')  # Create the database folder if it doesn't exist
+            os.mkdir(self.database_dir)  # Create the database folder if it doesn't exist
         except FileExistsError:
             pass
 
+    def codec_for_file(self, filename):
+        # Sniff the header so binary and JSON Lines files can live side by side
+        try:
+            with open(filename, 'rb') as f:
+                head = f.read(len(BinaryCodec.header))
+        except FileNotFoundError:
+            return self.codec
+        if head.startswith(BinaryCodec.MAGIC):
+            if head[len(BinaryCodec.MAGIC):] != bytes([BinaryCodec.SCHEMA_VERSION]):
+                raise ValueError(f"{filename} uses an unsupported record schema version")
+            return RECORD_CODECS["binary"]()
+        if head:
+            return RECORD_CODECS["jsonl"]()
+        return self.codec
+
+    def open_for_append(self, filename, codec=None):
+        # Returns (file, codec); new files start with the codec's header
+        codec = codec or self.codec_for_file(filename)
+        f = open(filename, 'ab')
+        if f.tell() == 0:
+            f.write(codec.header)
+            self.sync_directory(os.path.dirname(filename))  # The new file's name must survive a crash with its first record
+        elif filename not in self._checked_tails:
+            self.truncate_torn_tail(f, filename, codec)
+        return f, codec
+
+    @staticmethod
+    def sync_directory(directory):
+        fd = os.open(directory or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def truncate_torn_tail(self, f, filename, codec):
+        # A crash mid-append leaves part of a record; cut it off once so new records start on a boundary
+        with self._tails_lock:
+            if filename in self._checked_tails:
+                return
+            size = os.fstat(f.fileno()).st_size
+            with open(filename, 'rb') as reader:
+                end = codec.whole_records_end(reader, size)
+            if end < size:
+                f.truncate(end)
+                f.seek(end)  # Truncating leaves the position alone, and record offsets are taken from tell()
+            self._checked_tails.add(filename)
+
+    def iter_records(self, filename, with_offsets=False):
+        # Stream records one at a time instead of reading the whole file up front
+        codec = self.codec_for_file(filename)
+        try:
+            f = open(filename, 'rb')
+        except FileNotFoundError:
+            return
+        records = 0
+        try:
+            with f:
+                f.seek(len(codec.header))
+                for offset, record in codec.iter_decode(f):
+                    records += 1
+                    yield (offset, record) if with_offsets else record
+        finally:
+            if METRICS.enabled:
+                METRICS.increment("file.opens")
+                METRICS.increment("file.records_read", records)
+
+    @instrumented("file.write_records")
+    def write_records(self, filename, records, codec=None):
+        # Atomically replace a file with the given records
+        codec = codec or self.codec
+        temp_filename = filename + ".tmp"
+        count = 0
+        with open(temp_filename, 'wb') as f:
+            f.write(codec.header)
+            for record in records:
+                f.write(codec.encode(record))
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)  # Readers only ever see the old or the new file
+        return count
+
+    @instrumented("file.save_users_data")
     def save_users_data(self, users):
-        self.create_database_folder()  # Ensure the database folder exists
-        users_filename = "database/users_data.txt"
-        with open(users_filename, 'w') as f:
-            for user in users:
-                f.write(f"{user.user_data}\n")  # Write the user_data dictionary
+        # Atomically rewrite the whole users log with one record per account (users: username -> User)
+        with self._users_lock:
+            self._users_log_records = self.write_records(self.users_filename, (user.user_data for user in users.values()))
+
+    @instrumented("file.save_user")
+    def save_user(self, user, users=None):
+        # Append a single new or changed account instead of rewriting the whole file
+        record = dict(user.user_data)
+        with self._users_lock:
+            f, codec = self.open_for_append(self.users_filename)
+            with f:
+                f.write(codec.encode(record))
+                f.flush()
+                os.fsync(f.fileno())
+            self._users_log_records += 1
+            if self._users_compacting is not None:
+                self._users_compacting.append(record)  # Carried over into the compacted file
+        if users is not None:
+            self.maybe_compact_users_data(users)
+
+    def maybe_compact_users_data(self, users):
+        # Superseded records pile up as accounts change; compact in the background once they dominate the log
+        if self._users_compacting is not None:
+            return None
+        if self._users_log_records < max(self.USERS_COMPACT_MIN_RECORDS, 2 * len(users)):
+            return None
+        thread = threading.Thread(target=self.compact_users_data, args=(users,), daemon=True)
+        thread.start()
+        return thread
 
+    @instrumented("file.compact_users_data")
+    def compact_users_data(self, users):
+        with self._users_lock:
+            if self._users_compacting is not None:
+                return  # Another compaction is already running
+            self._users_compacting = []
+            snapshot = list(users.values())
+        try:
+            temp_filename = self.users_filename + ".tmp"
+            with open(temp_filename, 'wb') as f:
+                f.write(self.codec.header)
+                for user in snapshot:
+                    f.write(self.codec.encode(user.user_data))
+            with self._users_lock:
+                # Records appended meanwhile go after the snapshot so the latest record still wins
+                with open(temp_filename, 'ab') as f:
+                    for user_data in self._users_compacting:
+                        f.write(self.codec.encode(user_data))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_filename, self.users_filename)
+                self._users_log_records = len(snapshot) + len(self._users_compacting)
+        finally:
+            with self._users_lock:
+                self._users_compacting = None
+
+    @instrumented("file.load_users_data")
     def load_users_data(self):
-        self.create_database_folder()  # Ensure the database folder exists
-        users_filename = "database/users_data.txt"
-        if os.path.exists(users_filename):
-            with open(users_filename, 'r') as f:
-                data = f.readlines()
-            users = []
-            for line in data:
-                user_data = eval(line.strip())  # Convert the string representation back to a dictionary
-                # Create a new User object using the user_data dictionary
-                user = User(user_data["first_name"], user_data["last_name"], user_data["username"], user_data["password"])
-                users.append(user)
-            return users
-        return []
-
-    def save_purchase_history(self, username, purchase_record):
-        self.create_database_folder()  # Ensure the database folder exists
-        filename = f"database/{username}_purchase_history.txt"
-        with open(filename, 'a') as f:
-            f.write(f"{purchase_record}\n")
-
-    def load_purchase_history(self, username):
-        self.create_database_folder()  # Ensure the database folder exists
-        filename = f"database/{username}_purchase_history.txt"
+        # Returns a username -> User index; later records in the log replace earlier ones
+        users = {}
+        if os.path.exists(self.users_filename + ".tmp"):
+            os.remove(self.users_filename + ".tmp")  # Leftover from an interrupted compaction
+        records = 0
+        for user_data in self.iter_records(self.users_filename):
+            # Create a new User object using the user_data dictionary
+            users[user_data["username"]] = User(user_data["first_name"], user_data["last_name"], user_data["username"], user_data["password"])
+            records += 1
+        self._users_log_records = records
+        return users
+
+    @property
+    def order_log(self):
+        if self._order_log is None:
+            self._order_log = OrderLog.open(self)
+        return self._order_log
+
+    def history_filename(self, username):
+        # Legacy per-user history file, from before the shared order log; still read, no longer written
+        return os.path.join(self.database_dir, f"{username}_purchase_history.txt")
+
+    def cart_filename(self, username):
+        # Where SessionManager spills a cart that is no longer held in memory
+        return os.path.join(self.database_dir, f"{username}_cart.txt")
+
+    def save_cart(self, username, items):
+        self.write_records(self.cart_filename(username), items)
+
+    def load_cart(self, username):
+        return list(self.iter_records(self.cart_filename(username)))
+
+    def delete_cart(self, username):
         try:
-            with open(filename, 'r') as f:
-                data = f.readlines()
-            return [eval(line) for line in data if line.strip()]
+            os.remove(self.cart_filename(username))
         except FileNotFoundError:
-            return []
+            pass
+
+    def catalog_snapshot(self):
+        return CatalogSnapshot(self.database_dir)
+
+    @instrumented("file.append_purchase_records")
+    def append_purchase_records(self, purchases):
+        # purchases: (username, purchase record) pairs, appended to the shared order log in one write
+        self.order_log.append(purchases)
+
+    def sync_purchases(self):
+        self.order_log.sync()
+
+    def close(self):
+        super().close()
+        if self._order_log is not None:
+            self._order_log.close()
+
+    def history_entries(self, username):
+        # (timestamp, segment, offset, length) per order, oldest first; segment None means the legacy file
+        entries = []
+        filename = self.history_filename(username)
+        if os.path.exists(filename):
+            entries = [(timestamp, None, offset, 0) for offset, timestamp in self.purchase_history_index(filename).entries()]
+        entries.extend((timestamp, segment, offset, length) for segment, offset, length, timestamp in self.order_log.entries(username))
+        entries.sort(key=lambda entry: entry[0])  # Migrated legacy orders sit after newer ones in the log; stable for ties
+        return entries
+
+    @instrumented("file.load_purchase_history")
+    def load_purchase_history(self, username, limit=None, offset=0, since=None, until=None):
+        # All records oldest first by default; limit/offset page backwards from the newest order,
+        # since/until (datetimes) restrict to a date range. Only the selected records are parsed.
+        entries = self.history_entries(username)
+        timestamps = [entry[0] for entry in entries]
+        start, stop = 0, len(entries)
+        if since is not None:
+            start = bisect.bisect_left(timestamps, int(since.timestamp()))
+        if until is not None:
+            stop = bisect.bisect_right(timestamps, int(until.timestamp()))
+        stop = max(start, stop - offset)  # Pages count back from the newest order
+        if limit is not None:
+            start = max(start, stop - limit)
+        history = []
+        for legacy, group in itertools.groupby(entries[start:stop], key=lambda entry: entry[1] is None):
+            if legacy:
+                filename = self.history_filename(username)
+                codec = self.codec_for_file(filename)
+                with open(filename, 'rb') as f:
+                    for entry in group:
+                        f.seek(entry[2])
+                        history.append(next(codec.iter_decode(f))[1])
+            else:
+                for record in self.order_log.read(entry[1:] for entry in group):
+                    if record.get("username", username) == username:  # Skips another customer whose name hashed the same
+                        history.append(record)
+        return history
+
+    @instrumented("file.count_purchase_history")
+    def count_purchase_history(self, username):
+        filename = self.history_filename(username)
+        legacy = len(self.purchase_history_index(filename)) if os.path.exists(filename) else 0
+        return legacy + len(self.order_log.entries(username))
+
+    @instrumented("file.purchase_history_index")
+    def purchase_history_index(self, filename):
+        # Returns the sidecar index, first catching it up with any records it doesn't cover yet
+        index = PurchaseHistoryIndex(filename)
+        if index.covered_size() == os.path.getsize(filename):
+            return index
+        with index.lock:
+            covered = index.covered_size()
+            size = os.path.getsize(filename)
+            codec = self.codec_for_file(filename)
+            if covered > size or covered < len(codec.header):
+                index.reset()  # Missing or stale (the data file was rewritten): rebuild from scratch
+                covered = len(codec.header)
+            new_entries = []
+            with open(filename, 'rb') as f:
+                f.seek(covered)
+                for record_offset, record in codec.iter_decode(f):
+                    new_entries.append((record_offset, purchase_timestamp(record)))
+            index.append(new_entries, size)
+        return index
 
-# StoreOperations class (inherits from FileManagement)
-class StoreOperations(FileManagement):
-    def __init__(self,store_name):
+    def history_usernames(self):
+        # Customers that still have a legacy per-user history file
+        suffix = "_purchase_history.txt"
+        return sorted(name[:-len(suffix)] for name in os.listdir(self.database_dir) if name.endswith(suffix))
+
+    def purchases_mark(self):
+        return self.order_log.mark()  # Legacy files are no longer appended to
+
+    def iter_all_purchases(self, until=None):
+        # Every stored purchase record: legacy files one customer at a time, then the order log
+        for username in self.history_usernames():
+            yield from self.iter_records(self.history_filename(username))
+        yield from self.order_log.iter_records(until)
+
+    @instrumented("file.migrate_database")
+    def migrate_database(self, codec=None):
+        # One-shot rewrite of every database/*.txt file (legacy repr lines included) into the given codec;
+        # per-user purchase histories move into the shared order log instead. Run it with the store stopped.
+        codec = RECORD_CODECS[codec]() if codec else self.codec
+        suffix = "_purchase_history.txt"
+        migrated = 0
+        for name in sorted(os.listdir(self.database_dir)):
+            if not name.endswith(".txt"):
+                continue
+            filename = os.path.join(self.database_dir, name)
+            records = list(self.iter_records(filename))
+            if name.endswith(suffix):
+                self.append_purchase_records([(name[:-len(suffix)], record) for record in records])
+                self.order_log.sync()  # Durable in the log before the only other copy goes
+                os.remove(filename)
+            else:
+                self.write_records(filename, records, codec)
+            PurchaseHistoryIndex(filename).reset()  # Offsets changed; rebuilt on next paged read
+            migrated += 1
+        return migrated
+
+# SQLiteStorage class (the same data in one SQLite database: WAL mode, a pool of connections, indexed tables)
+class SQLiteStorage(StorageBackend):
+    name = "sqlite"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, first_name TEXT NOT NULL, last_name TEXT NOT NULL, password TEXT NOT NULL) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, title TEXT NOT NULL, title_key TEXT NOT NULL UNIQUE, price INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS products_by_price ON products (price, id)",
+        "CREATE TABLE IF NOT EXISTS stock (product_id INTEGER PRIMARY KEY REFERENCES products (id), quantity INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS orders (id INTEGER PRIMARY KEY, username TEXT NOT NULL, timestamp INTEGER NOT NULL, record TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS orders_by_user ON orders (username, timestamp)",
+        "CREATE TABLE IF NOT EXISTS carts (username TEXT PRIMARY KEY, items TEXT NOT NULL) WITHOUT ROWID",
+    )
+    # Statements are fixed strings with ? parameters, so each connection prepares them once and reuses them from its cache
+    _LOAD_USERS = "SELECT first_name, last_name, username, password FROM users"
+    _SAVE_USER = "INSERT OR REPLACE INTO users (first_name, last_name, username, password) VALUES (?, ?, ?, ?)"
+    _SAVE_CART = "INSERT OR REPLACE INTO carts (username, items) VALUES (?, ?)"
+    _LOAD_CART = "SELECT items FROM carts WHERE username = ?"
+    _DELETE_CART = "DELETE FROM carts WHERE username = ?"
+    _ADD_ORDER = "INSERT INTO orders (username, timestamp, record) VALUES (?, ?, ?)"
+    _PAGE_ORDERS = ("SELECT record FROM orders WHERE username = ? AND timestamp BETWEEN ? AND ? "
+                    "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?")
+    _COUNT_ORDERS = "SELECT COUNT(*) FROM orders WHERE username = ?"
+    _ALL_ORDERS = "SELECT record FROM orders WHERE id <= ? ORDER BY id"
+    _LAST_ORDER = "SELECT COALESCE(MAX(id), 0) FROM orders"
+
+    def __init__(self, database_dir="database", codec="jsonl", pool_size=8):
+        # codec is accepted for symmetry with FileManagement; records are stored as JSON text
         super().__init__()
-        self.products = []  # Initialize an empty list for products
-        self.users = self.load_users_data()  # Load data from file
+        self.database_dir = database_dir
+        os.makedirs(database_dir, exist_ok=True)
+        self.filename = os.path.join(database_dir, "store.db")
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()  # Idle connections, most recently used first so its cache is warm
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        with self.transaction() as connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+
+    def _connect(self):
+        # Autocommit mode; transactions are explicit. check_same_thread is off because the pool hands
+        # a connection to one thread at a time, not to the same thread every time.
+        connection = sqlite3.connect(self.filename, timeout=30, isolation_level=None, check_same_thread=False, cached_statements=64)
+        connection.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer or each other
+        connection.execute("PRAGMA synchronous=NORMAL")  # Commits reach the WAL; sync_purchases() fsyncs it
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        # Borrow a connection; at most pool_size are opened and further callers wait for one to come back
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._opened < self.pool_size
+                if create:
+                    self._opened += 1
+            if create:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._pool_lock:
+                        self._opened -= 1
+                    raise
+            else:
+                connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")  # Take the write lock up front instead of failing to upgrade later
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    @instrumented("sqlite.load_users_data")
+    def load_users_data(self):
+        with self.connection() as connection:
+            return {username: User(first_name, last_name, username, password) for first_name, last_name, username, password in connection.execute(self._LOAD_USERS)}
+
+    @instrumented("sqlite.save_user")
+    def save_user(self, user, users=None):
+        user_data = user.user_data
+        with self.connection() as connection:
+            connection.execute(self._SAVE_USER, (user_data["first_name"], user_data["last_name"], user_data["username"], user_data["password"]))
+
+    @instrumented("sqlite.save_users_data")
+    def save_users_data(self, users):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM users")
+            connection.executemany(self._SAVE_USER, ((user.user_data["first_name"], user.user_data["last_name"], user.user_data["username"], user.user_data["password"]) for user in users.values()))
+
+    def save_cart(self, username, items):
+        with self.connection() as connection:
+            connection.execute(self._SAVE_CART, (username, json.dumps(items)))
+
+    def load_cart(self, username):
+        with self.connection() as connection:
+            row = connection.execute(self._LOAD_CART, (username,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def delete_cart(self, username):
+        with self.connection() as connection:
+            connection.execute(self._DELETE_CART, (username,))
+
+    def catalog_snapshot(self):
+        return SQLiteCatalogSnapshot(self)
+
+    @instrumented("sqlite.append_purchase_records")
+    def append_purchase_records(self, purchases):
+        # One transaction per call, so a writer batch is one commit
+        with self.transaction() as connection:
+            connection.executemany(self._ADD_ORDER, (
+                (username, purchase_timestamp(purchase_record), json.dumps(purchase_record, separators=(",", ":")))
+                for username, purchase_record in purchases
+            ))
+
+    def sync_purchases(self):
+        # What synchronous=FULL would do at every commit, once per writer batch instead
+        try:
+            fd = os.open(self.filename + "-wal", os.O_RDONLY)
+        except FileNotFoundError:
+            return  # Checkpointed into the database file, which SQLite syncs itself
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @instrumented("sqlite.load_purchase_history")
+    def load_purchase_history(self, username, limit=None, offset=0, since=None, until=None):
+        first = -2**63 if since is None else int(since.timestamp())
+        last = 2**63 - 1 if until is None else int(until.timestamp())
+        with self.connection() as connection:
+            # Newest first so LIMIT/OFFSET page back from the latest order, then flipped to oldest first
+            rows = connection.execute(self._PAGE_ORDERS, (username, first, last, -1 if limit is None else limit, offset)).fetchall()
+        return [json.loads(record) for record, in reversed(rows)]
+
+    @instrumented("sqlite.count_purchase_history")
+    def count_purchase_history(self, username):
+        with self.connection() as connection:
+            return connection.execute(self._COUNT_ORDERS, (username,)).fetchone()[0]
+
+    def purchases_mark(self):
+        # Writers are serialized, so every id up to the largest committed one is committed too
+        with self.connection() as connection:
+            return connection.execute(self._LAST_ORDER).fetchone()[0]
+
+    def iter_all_purchases(self, until=None):
+        with self.connection() as connection:
+            cursor = connection.execute(self._ALL_ORDERS, (2**63 - 1 if until is None else until,))
+            for rows in iter(lambda: cursor.fetchmany(1024), []):
+                for record, in rows:
+                    yield json.loads(record)
+
+    def close(self):
+        super().close()
+        # Connections still borrowed are closed when they are garbage collected
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+STORAGE_BACKENDS = {backend.name: backend for backend in (FileManagement, SQLiteStorage)}
+
+def open_storage(storage="files", database_dir="database", codec="jsonl"):
+    # A backend by name (see STORAGE_BACKENDS); an already opened backend is passed through
+    if isinstance(storage, StorageBackend):
+        return storage
+    if storage not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {storage!r}; choose one of {', '.join(STORAGE_BACKENDS)}.")
+    return STORAGE_BACKENDS[storage](database_dir, codec)
+
+@instrumented("storage.import_data")
+def import_storage(source, target):
+    # Bulk copy of accounts, the catalog, spilled carts and every order from one backend into another.
+    # Run it with the store stopped; the target should be empty. Returns (users, products, orders) copied.
+    users = source.load_users_data()
+    target.save_users_data(users)
+    source_catalog = ProductCatalog(source.catalog_snapshot())
+    target_catalog = ProductCatalog(target.catalog_snapshot())
+    for product in source_catalog.products:
+        target_catalog.add(Product(product.title, product.price, product.stock_quantity))
+    source_catalog.snapshot.close()  # Read only: nothing to fold back in
+    target_catalog.close()
+    for username in users:
+        items = source.load_cart(username)
+        if items:
+            target.save_cart(username, items)
+    orders = 0
+    purchases = []
+    for purchase_record in source.iter_all_purchases():
+        purchases.append((purchase_record.get("username", ""), purchase_record))
+        if len(purchases) >= 4096:
+            target.append_purchase_records(purchases)
+            orders += len(purchases)
+            purchases = []
+    target.append_purchase_records(purchases)
+    orders += len(purchases)
+    target.sync_purchases()
+    return len(users), len(source_catalog), orders
+
+# SalesAnalytics class (columnar store of purchased line items with incrementally maintained aggregates)
+class SalesAnalytics:
+    def __init__(self):
+        self.product_ids = {}  # title -> dense product id
+        self.product_titles = []  # product id -> title
+        # One row per purchased line item; array.array columns share their buffer with NumPy without copying
+        self.order_column = array.array('q')
+        self.product_column = array.array('q')
+        self.day_column = array.array('q')  # Local calendar day of the purchase, as a date ordinal
+        self.quantity_column = array.array('q')
+        self.revenue_column = array.array('q')
+        # Aggregates kept up to date on every recorded purchase
+        self.product_revenue = array.array('q')  # product id -> revenue
+        self.product_units = array.array('q')  # product id -> units sold
+        self.day_revenue = collections.Counter()  # day -> revenue
+        self.orders = 0
+        self.total_revenue = 0
+        self.total_units = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.order_column)
+
+    def product_id(self, title):
+        product_id = self.product_ids.get(title)
+        if product_id is None:
+            product_id = self.product_ids[title] = len(self.product_titles)
+            self.product_titles.append(title)
+            self.product_revenue.append(0)
+            self.product_units.append(0)
+        return product_id
+
+    def record_purchase(self, purchase_record):
+        day = datetime.fromtimestamp(purchase_timestamp(purchase_record)).toordinal()  # Dates are recorded in local time
+        with self._lock:
+            order = self.orders
+            for item in purchase_record.get("items", []):
+                product_id = self.product_id(item["title"])
+                revenue = item["price"] * item["quantity"]
+                self.order_column.append(order)
+                self.product_column.append(product_id)
+                self.day_column.append(day)
+                self.quantity_column.append(item["quantity"])
+                self.revenue_column.append(revenue)
+                self.product_revenue[product_id] += revenue
+                self.product_units[product_id] += item["quantity"]
+                self.day_revenue[day] += revenue
+                self.total_revenue += revenue
+                self.total_units += item["quantity"]
+            self.orders += 1
+
+    def ingest(self, purchase_records):
+        # Bulk load, e.g. every record from FileManagement.iter_all_purchases()
+        for purchase_record in purchase_records:
+            self.record_purchase(purchase_record)
+        return self
+
+    def _day_range(self, since, until):
+        first = None if since is None else since.toordinal()
+        last = None if until is None else until.toordinal()
+        return first, last
+
+    def _per_product(self, column, since, until):
+        # Sum a column per product over a date range: vectorized with NumPy, a plain loop without it
+        first, last = self._day_range(since, until)
+        count = len(self.product_titles)
+        if numpy is not None:
+            days = numpy.frombuffer(self.day_column, dtype=numpy.int64)
+            mask = numpy.ones(len(days), dtype=bool)
+            if first is not None:
+                mask &= days >= first
+            if last is not None:
+                mask &= days <= last
+            products = numpy.frombuffer(self.product_column, dtype=numpy.int64)[mask]
+            values = numpy.frombuffer(column, dtype=numpy.int64)[mask]
+            return numpy.bincount(products, weights=values, minlength=count).astype(numpy.int64).tolist()
+        totals = [0] * count
+        for product_id, day, value in zip(self.product_column, self.day_column, column):
+            if (first is None or day >= first) and (last is None or day <= last):
+                totals[product_id] += value
+        return totals
+
+    def revenue_by_product(self, since=None, until=None):
+        with self._lock:
+            if since is None and until is None:
+                totals = self.product_revenue.tolist()  # Maintained at checkout; no scan needed
+            else:
+                totals = self._per_product(self.revenue_column, since, until)
+            return {title: totals[product_id] for product_id, title in enumerate(self.product_titles)}
+
+    def units_by_product(self, since=None, until=None):
+        with self._lock:
+            if since is None and until is None:
+                totals = self.product_units.tolist()
+            else:
+                totals = self._per_product(self.quantity_column, since, until)
+            return {title: totals[product_id] for product_id, title in enumerate(self.product_titles)}
+
+    def revenue_by_day(self, since=None, until=None):
+        # {date: revenue}, oldest first
+        first, last = self._day_range(since, until)
+        with self._lock:
+            days = sorted(day for day in self.day_revenue if (first is None or day >= first) and (last is None or day <= last))
+            return {datetime.fromordinal(day).date(): self.day_revenue[day] for day in days}
+
+    def revenue_by_product_and_day(self, since=None, until=None):
+        # {(title, date): revenue}; grouped in one pass over the selected rows
+        first, last = self._day_range(since, until)
+        with self._lock:
+            if numpy is not None:
+                days = numpy.frombuffer(self.day_column, dtype=numpy.int64)
+                mask = numpy.ones(len(days), dtype=bool)
+                if first is not None:
+                    mask &= days >= first
+                if last is not None:
+                    mask &= days <= last
+                if not mask.any():
+                    return {}
+                keys = numpy.stack([numpy.frombuffer(self.product_column, dtype=numpy.int64)[mask], days[mask]])
+                groups, inverse = numpy.unique(keys, axis=1, return_inverse=True)
+                sums = numpy.bincount(inverse.ravel(), weights=numpy.frombuffer(self.revenue_column, dtype=numpy.int64)[mask])
+                grouped = {(int(product_id), int(day)): int(total) for (product_id, day), total in zip(groups.T, sums)}
+            else:
+                grouped = collections.Counter()
+                for product_id, day, revenue in zip(self.product_column, self.day_column, self.revenue_column):
+                    if (first is None or day >= first) and (last is None or day <= last):
+                        grouped[(product_id, day)] += revenue
+            return {(self.product_titles[product_id], datetime.fromordinal(day).date()): total
+                    for (product_id, day), total in sorted(grouped.items(), key=lambda entry: entry[0][1])}
+
+    def top_sellers(self, n=10, by="revenue", since=None, until=None):
+        totals = self.revenue_by_product(since, until) if by == "revenue" else self.units_by_product(since, until)
+        return heapq.nlargest(n, totals.items(), key=lambda entry: entry[1])
+
+    def average_basket_size(self):
+        # Units per order
+        with self._lock:
+            return self.total_units / self.orders if self.orders else 0.0
+
+    def average_basket_value(self):
+        with self._lock:
+            return self.total_revenue / self.orders if self.orders else 0.0
+
+# RecommendationEngine class (sparse product co-occurrence counts with cached top-K "also bought" rankings)
+class RecommendationEngine:
+    MAX_ORDER_LINES = 50  # Pairs grow with the square of an order's lines; huge orders only count their first lines
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k  # Rankings kept per product; cart queries merge these instead of scanning whole rows
+        self.pairs = {}  # lowercased title -> Counter of lowercased title -> orders containing both
+        self.titles = {}  # lowercased title -> title as sold
+        # lowercased title -> [(other, count), ...] best first; replaced, never mutated, so readers need no lock
+        self.rankings = {}
+        self.orders = 0
+        self._lock = threading.Lock()  # Serializes writers only
+        self._queue = queue.Queue()  # Checkouts hand orders to the worker instead of updating counts themselves
+        self._worker = None
+
+    def _order_keys(self, purchase_record):
+        keys = {}
+        for item in purchase_record.get("items", []):
+            key = item["title"].lower()
+            keys.setdefault(key, item["title"])
+            self.titles.setdefault(key, item["title"])
+        return list(keys)[:self.MAX_ORDER_LINES]
+
+    @staticmethod
+    def rank_key(entry):
+        # Most orders first, ties by title, so incremental updates and a bulk rebuild agree exactly
+        return -entry[1], entry[0]
+
+    def record_purchase(self, purchase_record):
+        # Counts only ever grow, so a product can only enter a ranking by beating the last entry it had before
+        # this order; the changed counts are merged into the ranking and truncated once
+        with self._lock:
+            keys = self._order_keys(purchase_record)
+            for key in keys:
+                row = self.pairs.setdefault(key, collections.Counter())
+                ranking = self.rankings.get(key, [])
+                ranked = {other for other, _ in ranking}
+                floor = self.rank_key(ranking[-1]) if len(ranking) >= self.top_k else None
+                changed = {}
+                for other in keys:
+                    if other != key:
+                        row[other] += 1
+                        if other in ranked or floor is None or self.rank_key((other, row[other])) < floor:
+                            changed[other] = row[other]
+                if changed:
+                    merged = [entry for entry in ranking if entry[0] not in changed] + list(changed.items())
+                    merged.sort(key=self.rank_key)
+                    self.rankings[key] = merged[:self.top_k]
+            self.orders += 1
+
+    def ingest(self, purchase_records):
+        # Bulk rebuild, e.g. from StorageBackend.iter_all_purchases(): count every pair first, rank once at the end
+        with self._lock:
+            for purchase_record in purchase_records:
+                keys = self._order_keys(purchase_record)
+                for key in keys:
+                    row = self.pairs.setdefault(key, collections.Counter())
+                    row.update(other for other in keys if other != key)
+                self.orders += 1
+            self.rankings = {key: heapq.nsmallest(self.top_k, row.items(), key=self.rank_key) for key, row in self.pairs.items()}
+        return self
+
+    def submit(self, purchase_record):
+        # Record an order on the background worker, off the caller's path
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="recommendations", daemon=True)
+                    self._worker.start()
+        self._queue.put(purchase_record)
+
+    def _run(self):
+        while True:
+            purchase_record = self._queue.get()
+            try:
+                if purchase_record is None:
+                    return
+                self.record_purchase(purchase_record)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        # Wait until every submitted order has been counted
+        if self._worker is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def also_bought(self, title, k=5):
+        # Products most often ordered together with this one, as (title, orders together) pairs
+        ranking = self.rankings.get(title.strip().lower(), [])
+        return [(self.titles[other], count) for other, count in ranking[:k]]
+
+    def for_cart(self, titles, k=5):
+        # Merge the cached rankings of every product in the cart, leaving out what is already in it
+        keys = {title.strip().lower() for title in titles}
+        scores = collections.Counter()
+        for key in keys:
+            for other, count in self.rankings.get(key, []):
+                if other not in keys:
+                    scores[other] += count
+        return [(self.titles[other], score) for other, score in heapq.nsmallest(k, scores.items(), key=self.rank_key)]
+
+# CatalogSnapshot class (fixed-width on-disk catalog, memory-mapped at startup, plus a stock-change journal)
+class CatalogSnapshot:
+    # Snapshot layout: header, then fixed-width blocks: titles (NUL padded), prices, stock,
+    # product indexes sorted by lowercased title, product indexes sorted by price
+    MAGIC = b"SHOPCAT"
+    VERSION = 1
+    _HEADER = struct.Struct("<7sBII")  # magic, version, product count, title width
+    _STOCK = struct.Struct("<cIq")  # b"S", product index, new stock
+    _ADD = struct.Struct("<cIqqH")  # b"A", product index, price, stock, title length; title bytes follow
+    _INDEX = struct.Struct("<I")
+    CHECKPOINT_RECORDS = 100000  # Fold the journal into a new snapshot after this many records
+
+    def __init__(self, database_dir=None):
+        # Without a database_dir nothing is persisted (everything lives in the "added" list)
+        self.filename = os.path.join(database_dir, "catalog.dat") if database_dir else None
+        self.journal_filename = os.path.join(database_dir, "stock.journal") if database_dir else None
+        self.on_journal_full = None  # Called (once) when the journal passes CHECKPOINT_RECORDS
+        self.base_count = 0  # Products in the mapped snapshot
+        self.title_width = 0
+        self.added = []  # [title, price, stock] for products added since the snapshot
+        self.stock_overrides = {}  # snapshot product index -> stock changed since the snapshot
+        self._map = None
+        self._blocks = None  # (titles, prices, stock, title order, price order) offsets
+        self._mapped = (None, None, 0)  # (map, blocks, title width), swapped as one so readers never mix two snapshots
+        self._journal_fd = None
+        self._journal_records = 0
+        self._lock = threading.Lock()
+        if self.filename:
+            self._map_snapshot()
+            self._replay_journal()
+            self._journal_fd = os.open(self.journal_filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    @classmethod
+    def layout(cls, count, title_width):
+        titles = cls._HEADER.size
+        prices = (titles + count * title_width + 7) // 8 * 8  # 8-byte aligned numeric columns
+        stock = prices + 8 * count
+        title_order = stock + 8 * count
+        price_order = title_order + 4 * count
+        return titles, prices, stock, title_order, price_order
+
+    def _map_snapshot(self):
+        # A replaced map is not closed here: lock-free readers may still hold it, and it closes once they let go
+        try:
+            with open(self.filename, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self._HEADER.size:
+                    return
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        magic, version, count, title_width = self._HEADER.unpack_from(mapped, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{self.filename} is not a version {self.VERSION} catalog snapshot")
+        self._map, self._blocks, self.title_width = mapped, self.layout(count, title_width), title_width
+        self._mapped = (self._map, self._blocks, title_width)
+        self.base_count = count
+
+    def _replay_journal(self):
+        try:
+            with open(self.journal_filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        pos = 0
+        while pos < len(data):
+            kind = data[pos:pos + 1]
+            if kind == b"S" and pos + self._STOCK.size <= len(data):
+                _, index, stock = self._STOCK.unpack_from(data, pos)
+                pos += self._STOCK.size
+                if index < self.count:
+                    self._set_stock(index, stock)
+            elif kind == b"A" and pos + self._ADD.size <= len(data):
+                _, index, price, stock, length = self._ADD.unpack_from(data, pos)
+                if pos + self._ADD.size + length > len(data):
+                    break
+                title = data[pos + self._ADD.size:pos + self._ADD.size + length].decode()
+                pos += self._ADD.size + length
+                if index == self.count:
+                    self.added.append([title, price, stock])
+                elif index > self.count:
+                    break  # A gap means the rest can't be trusted
+                # index < count: already folded into the snapshot by a checkpoint that crashed before truncating
+            else:
+                break
+            self._journal_records += 1
+        if pos < len(data):
+            os.truncate(self.journal_filename, pos)  # Drop a torn tail so new records append cleanly
+
+    @property
+    def count(self):
+        return self.base_count + len(self.added)
+
+    def title(self, index):
+        if index >= self.base_count:
+            return self.added[index - self.base_count][0]
+        mapped, blocks, title_width = self._mapped
+        start = blocks[0] + index * title_width
+        return mapped[start:start + title_width].rstrip(b"\0").decode()
+
+    def by_title(self, position):
+        # Product index at a position of the snapshot's title order
+        mapped, blocks, _ = self._mapped
+        return self._INDEX.unpack_from(mapped, blocks[3] + 4 * position)[0]
+
+    def by_price(self, position):
+        mapped, blocks, _ = self._mapped
+        return self._INDEX.unpack_from(mapped, blocks[4] + 4 * position)[0]
+
+    def read_column(self, name):
+        # Price or stock of every product as an array('q'), journaled changes included
+        column = array.array('q')
+        if self._map is not None:
+            start = self._blocks[1 if name == "price" else 2]
+            column.frombytes(self._map[start:start + 8 * self.base_count])
+        if name == "stock":
+            for index, value in self.stock_overrides.items():
+                column[index] = value
+        column.extend(entry[1 if name == "price" else 2] for entry in self.added)
+        return column
+
+    def _set_stock(self, index, stock):
+        if index >= self.base_count:
+            self.added[index - self.base_count][2] = stock
+        else:
+            self.stock_overrides[index] = stock
+
+    def _journal(self, data):
+        if self._journal_fd is None:
+            return
+        os.write(self._journal_fd, data)  # Unbuffered, so a crashed process loses nothing it acknowledged
+        self._journal_records += 1
+        if self._journal_records == self.CHECKPOINT_RECORDS and self.on_journal_full is not None:
+            self.on_journal_full()
+
+    def add(self, title, price, stock):
+        encoded = title.encode()
+        with self._lock:
+            index = self.count
+            self.added.append([title, price, stock])
+            self._journal(self._ADD.pack(b"A", index, price, stock, len(encoded)) + encoded)
+        return index
+
+    def record_stock(self, index, stock):
+        with self._lock:
+            self._set_stock(index, stock)
+            self._journal(self._STOCK.pack(b"S", index, stock))
+
+    def has_changes(self):
+        # Anything journaled that a checkpoint would fold in (never true in memory or once closed)
+        return self._journal_fd is not None and bool(self.added or self.stock_overrides or self._map is None)
+
+    def checkpoint(self, title_keys=None, price_keys=None):
+        # Write a new snapshot holding everything journaled so far, swap it in, then empty the journal.
+        # title_keys/price_keys are the sorted (key, index) orders of all products, supplied by the catalog.
+        with self._lock:
+            if not self.has_changes():
+                return
+            count = self.count
+            title_width = max([self.title_width] + [len(title.encode()) for title, _, _ in self.added] + [1])
+            titles = bytearray()
+            if self._map is not None and title_width == self.title_width:
+                titles += self._map[self._blocks[0]:self._blocks[0] + self.base_count * self.title_width]
+            else:
+                for index in range(self.base_count):
+                    titles += self.title(index).encode().ljust(title_width, b"\0")
+            for title, _, _ in self.added:
+                titles += title.encode().ljust(title_width, b"\0")
+            prices = self.read_column("price")
+            stock = self.read_column("stock")
+            title_order = array.array('I', (index for _, index in title_keys))
+            price_order = array.array('I', (index for _, index in price_keys))
+            blocks = self.layout(count, title_width)
+            temp_filename = self.filename + ".tmp"
+            with open(temp_filename, 'wb') as f:
+                f.write(self._HEADER.pack(self.MAGIC, self.VERSION, count, title_width))
+                f.write(titles)
+                f.write(b"\0" * (blocks[1] - blocks[0] - len(titles)))
+                for column in (prices, stock, title_order, price_order):
+                    f.write(column.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_filename, self.filename)
+            self.added = []
+            self.stock_overrides = {}
+            self._map_snapshot()
+            os.ftruncate(self._journal_fd, 0)  # Safe: replaying it again over the new snapshot is a no-op
+            self._journal_records = 0
+
+    def close(self):
+        if self._journal_fd is not None:
+            os.close(self._journal_fd)
+            self._journal_fd = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._mapped = (None, None, 0)
+
+# SQLiteCatalogSnapshot class (the CatalogSnapshot interface over SQLiteStorage's products and stock tables)
+class SQLiteCatalogSnapshot:
+    # Every change is written through to SQLite at once; a checkpoint only folds added products
+    # into the in-memory sorted orders that ProductCatalog searches
+    def __init__(self, storage):
+        self.storage = storage
+        self.on_journal_full = None  # SQLite keeps its own log; nothing to fold
+        self.added = []  # [title, price, stock] for products added since opening or the last checkpoint
+        self._lock = threading.Lock()
+        with storage.connection() as connection:
+            rows = connection.execute("SELECT products.id, title, price, quantity FROM products JOIN stock ON stock.product_id = products.id ORDER BY products.id").fetchall()
+            self._title_order = array.array('I', (index for index, in connection.execute("SELECT id FROM products ORDER BY title_key")))
+            self._price_order = array.array('I', (index for index, in connection.execute("SELECT id FROM products ORDER BY price, id")))
+        self._titles = [title for _, title, _, _ in rows]
+        self._prices = array.array('q', (price for _, _, price, _ in rows))
+        self._stock = array.array('q', (stock for _, _, _, stock in rows))
+        self.base_count = len(rows)
+
+    @property
+    def count(self):
+        return self.base_count + len(self.added)
+
+    def title(self, index):
+        if index >= self.base_count:
+            return self.added[index - self.base_count][0]
+        return self._titles[index]
+
+    def by_title(self, position):
+        return self._title_order[position]
+
+    def by_price(self, position):
+        return self._price_order[position]
+
+    def read_column(self, name):
+        column = array.array('q', self._prices if name == "price" else self._stock)
+        column.extend(entry[1 if name == "price" else 2] for entry in self.added)
+        return column
+
+    def add(self, title, price, stock):
+        with self._lock:
+            index = self.count
+            with self.storage.transaction() as connection:
+                connection.execute("INSERT INTO products (id, title, title_key, price) VALUES (?, ?, ?, ?)", (index, title, title.lower(), price))
+                connection.execute("INSERT INTO stock (product_id, quantity) VALUES (?, ?)", (index, stock))
+            self.added.append([title, price, stock])
+        return index
+
+    def record_stock(self, index, stock):
+        with self.storage.connection() as connection:
+            connection.execute("UPDATE stock SET quantity = ? WHERE product_id = ?", (stock, index))
+
+    def has_changes(self):
+        return bool(self.added)
+
+    def checkpoint(self, title_keys=None, price_keys=None):
+        with self._lock:
+            for title, price, stock in self.added:
+                self._titles.append(title)
+                self._prices.append(price)
+                self._stock.append(stock)
+            self._title_order = array.array('I', (index for _, index in title_keys))
+            self._price_order = array.array('I', (index for _, index in price_keys))
+            self.base_count = self.count
+            self.added = []
+
+    def close(self):
+        pass  # The connections belong to the storage backend
+
+# ProductTable class (struct-of-arrays product storage: one column per field instead of one object per product)
+class ProductTable:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot  # Persists appends and stock changes
+        self.prices = snapshot.read_column("price")  # array('q'), 8 bytes per product
+        self.stock = snapshot.read_column("stock")
+        # Snapshot titles stay in the mapped file's packed title block (no str object per product);
+        # only titles added since the snapshot are held in memory
+        self.added_titles = (snapshot.base_count, [title for title, _, _ in snapshot.added])
+        # product index -> units held by carts: gone from self.stock, but still in stock on disk,
+        # since holds only live in memory and a restart must not lose them from inventory
+        self.held = collections.Counter()
+
+    def __len__(self):
+        return len(self.prices)
+
+    def title(self, index):
+        base_count, titles = self.added_titles
+        if index < base_count:
+            return self.snapshot.title(index)
+        return titles[index - base_count]
+
+    def folded(self):
+        # After a checkpoint every title is in the snapshot file
+        self.added_titles = (self.snapshot.base_count, [])
+
+    def append(self, title, price, stock):
+        index = self.snapshot.add(title, price, stock)
+        self.added_titles[1].append(title)
+        self.prices.append(price)
+        self.stock.append(stock)
+        return index
+
+    def set_stock(self, index, stock):
+        self.stock[index] = stock
+        self.snapshot.record_stock(index, stock + self.held[index])  # Journal it so restarts keep it
+
+    def hold(self, index, quantity):
+        # Cart holds (and their release) only move units between stock and held; nothing is journaled
+        self.stock[index] -= quantity
+        self.held[index] += quantity
+        if not self.held[index]:
+            del self.held[index]
+
+    def sell_held(self, index, quantity):
+        # A checkout is the first time held units leave the persisted stock
+        self.held[index] -= quantity
+        stock = self.stock[index] + self.held[index]
+        if not self.held[index]:
+            del self.held[index]
+        self.snapshot.record_stock(index, stock)
+
+    def view(self, index):
+        return ProductView(self, index)
+
+# ProductView class (a Product whose fields live in one row of a ProductTable)
+class ProductView(Product):
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def title(self):
+        return self.table.title(self.index)
+
+    @property
+    def price(self):
+        return self.table.prices[self.index]
+
+    @property
+    def stock_quantity(self):
+        return self.table.stock[self.index]
+
+    @stock_quantity.setter
+    def stock_quantity(self, stock_quantity):
+        self.table.set_stock(self.index, stock_quantity)
+
+    def update_stock(self, quantity):
+        self.table.set_stock(self.index, max(0, self.table.stock[self.index] + quantity))  # Stock doesn't go negative
+
+    def hold_stock(self, quantity):
+        self.table.hold(self.index, quantity)
+
+    def sell_held_stock(self, quantity):
+        self.table.sell_held(self.index, quantity)
+
+    # Views are created on demand, so two views of the same row must compare equal
+    def __eq__(self, other):
+        if not isinstance(other, ProductView):
+            return NotImplemented
+        return self.table is other.table and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+class _SnapshotOrder:
+    # Sequence view over one of the snapshot's sorted orders so bisect can search it in place
+    def __init__(self, snapshot, position_to_index, key):
+        self.snapshot = snapshot
+        self.position_to_index = position_to_index
+        self.key = key
+
+    def __len__(self):
+        return self.snapshot.base_count
+
+    def __getitem__(self, position):
+        return self.key(self.position_to_index(position))
+
+# ProductCatalog class (title, prefix and price indexes behind StoreOperations)
+class ProductCatalog:
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot or CatalogSnapshot()  # Where products and stock are kept (in memory if not given)
+        self.snapshot.on_journal_full = self.checkpoint_in_background
+        self.table = ProductTable(self.snapshot)  # Titles, prices and stock held column-wise
+        self.products = CatalogProducts(self)  # Products in menu order, as views into the table
+        self._lock = threading.RLock()  # Guards the indexes and the snapshot mapping during a checkpoint
+        self._index_added_products()
+
+    def _index_added_products(self):
+        # The snapshot carries sorted title and price orders for its own products;
+        # only products added since then are indexed in memory
+        self._by_title = {}  # lowercased title -> product index
+        self._titles = []  # Sorted lowercased titles for prefix search
+        self._prices = []  # Sorted (price, product index) pairs for range and top-N queries
+        self._snapshot_titles = _SnapshotOrder(self.snapshot, self.snapshot.by_title, lambda index: self.table.title(index).lower())
+        self._snapshot_prices = _SnapshotOrder(self.snapshot, self.snapshot.by_price, self.table.prices.__getitem__)
+        for index in range(self.snapshot.base_count, self.snapshot.count):
+            self._index_product(index, self.table.title(index).lower(), self.table.prices[index])
+
+    def _index_product(self, index, key, price):
+        self._by_title[key] = index
+        bisect.insort(self._titles, key)
+        bisect.insort(self._prices, (price, index))
+
+    def __len__(self):
+        return self.snapshot.count
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __getitem__(self, index):
+        return self.products[index]
+
+    def product_at(self, index):
+        return self.table.view(index)
+
+    def _index_of(self, key):
+        index = self._by_title.get(key)
+        if index is None:
+            position = bisect.bisect_left(self._snapshot_titles, key)
+            if position < self.snapshot.base_count and self._snapshot_titles[position] == key:
+                index = self.snapshot.by_title(position)
+        return index
+
+    def add(self, product):
+        # Copies the product into the table and returns the catalog's view of it
+        key = product.title.lower()
+        with self._lock:
+            if self._index_of(key) is not None:
+                raise LibraryException(f"The product '{product.title}' is already in the catalog.")
+            index = self.table.append(product.title, product.price, product.stock_quantity)
+            self._index_product(index, key, product.price)
+        return self.product_at(index)
+
+    def find(self, title):
+        with self._lock:
+            index = self._index_of(title.strip().lower())
+            return None if index is None else self.product_at(index)
+
+    def search_prefix(self, prefix, limit=10):
+        # Titles are sorted, so every match sits in one contiguous run starting at the bisect point
+        prefix = prefix.strip().lower()
+        matches = []
+        with self._lock:
+            start = bisect.bisect_left(self._snapshot_titles, prefix)
+            in_snapshot = ((self._snapshot_titles[position], self.snapshot.by_title(position)) for position in range(start, self.snapshot.base_count))
+            added = ((key, self._by_title[key]) for key in self._titles[bisect.bisect_left(self._titles, prefix):])
+            for key, index in heapq.merge(in_snapshot, added):
+                if not key.startswith(prefix) or len(matches) == limit:
+                    break
+                matches.append(self.product_at(index))
+        return matches
+
+    def _in_stock(self, index):
+        return self.table.stock[index] > 0
+
+    def price_range(self, min_price=None, max_price=None, in_stock=True, limit=None):
+        matches = []
+        with self._lock:
+            start = 0 if min_price is None else bisect.bisect_left(self._snapshot_prices, min_price)
+            in_snapshot = ((self._snapshot_prices[position], self.snapshot.by_price(position)) for position in range(start, self.snapshot.base_count))
+            added = self._prices[0 if min_price is None else bisect.bisect_left(self._prices, (min_price, -1)):]
+            for price, index in heapq.merge(in_snapshot, added):
+                if max_price is not None and price > max_price:
+                    break
+                if in_stock and not self._in_stock(index):
+                    continue  # Stock is read live so the index never goes stale
+                matches.append(self.product_at(index))
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def top_by_price(self, n, highest=True, in_stock=True):
+        matches = []
+        with self._lock:
+            positions = range(self.snapshot.base_count - 1, -1, -1) if highest else range(self.snapshot.base_count)
+            in_snapshot = ((self._snapshot_prices[position], self.snapshot.by_price(position)) for position in positions)
+            added = reversed(self._prices) if highest else iter(self._prices)
+            for price, index in heapq.merge(in_snapshot, added, reverse=highest):
+                if len(matches) == n:
+                    break
+                if in_stock and not self._in_stock(index):
+                    continue
+                matches.append(self.product_at(index))
+        return matches
+
+    def checkpoint(self):
+        # Fold added products and journaled stock into a fresh snapshot
+        with self._lock:
+            if not self.snapshot.has_changes():
+                return
+            count = self.snapshot.count
+            title_keys = sorted((self.table.title(index).lower(), index) for index in range(self.snapshot.base_count, count))
+            price_keys = sorted((self.table.prices[index], index) for index in range(self.snapshot.base_count, count))
+            snapshot_titles = ((self._snapshot_titles[position], self.snapshot.by_title(position)) for position in range(self.snapshot.base_count))
+            snapshot_prices = ((self._snapshot_prices[position], self.snapshot.by_price(position)) for position in range(self.snapshot.base_count))
+            self.snapshot.checkpoint(list(heapq.merge(snapshot_titles, title_keys)), list(heapq.merge(snapshot_prices, price_keys)))
+            self.table.folded()
+            self._index_added_products()
+
+    def checkpoint_in_background(self):
+        threading.Thread(target=self.checkpoint, daemon=True).start()
+
+    def close(self):
+        self.checkpoint()
+        self.snapshot.close()
+
+class CatalogProducts:
+    # Read-only sequence of the catalog's products in menu order
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.catalog.product_at(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("product index out of range")
+        return self.catalog.product_at(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.catalog.product_at(index)
+
+# StoreOperations class (catalog, carts and checkout over a StorageBackend)
+class StoreOperations:
+    def __init__(self,store_name, database_dir="database", codec="jsonl", hold_ttl=900, fsync_policy="batch", storage="files"):
+        self.storage = open_storage(storage, database_dir, codec)  # A StorageBackend, or the name of one to open
+        self.storage.purchase_writer = PurchaseWriter(self.storage, fsync_policy)  # Checkouts are written in batches
+        atexit.register(self.storage.close)  # Flushes queued orders, then closes the order log; closing twice is harmless
+        self.inventory = InventoryEngine(hold_ttl)  # Stock held by carts is released after hold_ttl seconds
+        self._analytics = None  # Built from the stored histories on first use
+        self._recommendations = None  # Likewise; view_cart never waits for it
+        self._recommendations_started = False
+        # A first ingest scans the stored orders up to a high-water mark taken while no save is in flight;
+        # orders saved after the mark are buffered and replayed, so each is counted once and checkouts never
+        # wait for the scan itself
+        self._ingest_lock = threading.Condition()
+        self._ingesting = 0  # Ingests waiting for in-flight saves to finish before taking their mark
+        self._saves_in_flight = 0
+        self._pending = {}  # Attribute being built -> orders saved since its mark
+        self.inventory.start_reaper()
+        self.catalog = ProductCatalog(self.storage.catalog_snapshot())  # Indexed catalog, persisted by the storage backend
+        self.products = self.catalog.products  # Products in menu order
+        atexit.register(self.catalog.close)  # Fold the stock journal into the snapshot on shutdown
         self.store_name=store_name
 
+    @instrumented("store.add_product")
     def add_product(self, title, price, stock_quantity):
-        self.products.append(Product(title, price, stock_quantity))
+        return self.catalog.add(Product(title, price, stock_quantity))
+
+    def _ingested(self, name, build):
+        # One scan of the stored orders, then checkouts keep the result current
+        if getattr(self, name) is not None:
+            return getattr(self, name)
+        with self._ingest_lock:
+            while name in self._pending:  # Another thread is already scanning for it
+                self._ingest_lock.wait()
+            if getattr(self, name) is not None:
+                return getattr(self, name)
+            # New checkouts wait only while the saves already in flight finish, not for the scan
+            self._ingesting += 1
+            try:
+                self._ingest_lock.wait_for(lambda: self._saves_in_flight == 0)
+                mark = self.storage.purchases_mark()
+                self._pending[name] = []
+            finally:
+                self._ingesting -= 1
+                self._ingest_lock.notify_all()
+        try:
+            result = build().ingest(self.storage.iter_all_purchases(mark))
+            while True:
+                # Replay what was saved during the scan in rounds, so checkouts aren't held up by the lock either
+                with self._ingest_lock:
+                    pending = self._pending[name]
+                    if not pending:
+                        del self._pending[name]  # In the same hold as publishing, so no order is both buffered and recorded
+                        setattr(self, name, result)
+                        self._ingest_lock.notify_all()
+                        return result
+                    self._pending[name] = []
+                for purchase_record in pending:
+                    result.record_purchase(purchase_record)
+        finally:
+            with self._ingest_lock:
+                if self._pending.pop(name, None) is not None:  # The scan failed; the next caller starts over
+                    self._ingest_lock.notify_all()
+
+    @property
+    def analytics(self):
+        return self._ingested("_analytics", SalesAnalytics)
+
+    @property
+    def recommendations(self):
+        return self._ingested("_recommendations", RecommendationEngine)
+
+    def also_bought(self, titles, k=3):
+        # Suggestions for a cart; until the first build has finished in the background there are none
+        recommendations = self._recommendations
+        if recommendations is None:
+            with self._ingest_lock:
+                start = not self._recommendations_started
+                self._recommendations_started = True
+            if start:
+                threading.Thread(target=lambda: self.recommendations, name="recommendations-build", daemon=True).start()
+            return []
+        return recommendations.for_cart(titles, k)
+
+    def attach_cart(self, user):
+        # Route the user's cart through the store's inventory so its stock is held atomically
+        user.cart.inventory = self.inventory
+        user.cart.recommender = self.also_bought
+        return user.cart
+
+    @instrumented("store.find_product")
+    def find_product(self, product_title):
+        return self.catalog.find(product_title)
+
+    @instrumented("store.search_products")
+    def search_products(self, prefix, limit=10):
+        return self.catalog.search_prefix(prefix, limit)
 
+    @instrumented("store.products_in_price_range")
+    def products_in_price_range(self, min_price=None, max_price=None, limit=None):
+        return self.catalog.price_range(min_price, max_price, limit=limit)
+
+    @instrumented("store.update_stock")
     def update_stock(self, product_title, quantity):
-        for product in self.products:
-            if product.title.lower() == product_title.lower():
-                product.update_stock(quantity)
-                print(f"Updated stock for {product_title}. New quantity: {product.stock_quantity}")
-                return
-        raise ProductNotAvailableException(product_title)
+        product = self.catalog.find(product_title)
+        if product is None:
+            raise ProductNotAvailableException(product_title)
+        product.update_stock(quantity)
+        print(f"Updated stock for {product_title}. New quantity: {product.stock_quantity}")
 
-    def display_products(self):
-        if self.products:
-            for i, product in enumerate(self.products, 1):
-                print(f"{i}. ", end="")
-                product.display()
+    @instrumented("store.display_products")
+    def display_products(self, page_size=20):
+        # Show the catalog a page at a time; later pages are only read if asked for
+        total = len(self.products)
+        shown = 0
+        if total:
+            while shown < total:
+                for i, product in enumerate(self.products[shown:shown + page_size], shown + 1):
+                    print(f"{i}. ", end="")
+                    product.display()
+                shown = min(shown + page_size, total)
+                if shown >= total:
+                    break
+                more = input(f"\nShowing {shown} of {total} products. View more products (yes/no)?: ").lower().strip()
+                if more != 'yes':
+                    break
         else:
             print_red("No products available.\n-------------------------------")
 
-    def feedback_form(self):
+    def feedback_form(self, feedback=None):
+        # Passing feedback records it without prompting (e.g. from the JSON service); '' means no feedback
+        if feedback is not None:
+            if feedback.strip():
+                print_green(f"Thank you for your feedback: {feedback}\n")
+            return feedback.strip() or None
         try:
             while True:
                 feedback = input("Would you like to give feedback on our Services(yes/no)?: ").lower()
@@ -191,12 +2728,12 @@ class StoreOperations(FileManagement):
                     feedback_form = input("Give your Feedback here: ")
                     if feedback_form.strip():
                         print_green(f"Thank you for your feedback: {feedback_form}\n")
-                        break
+                        return feedback_form.strip()
                     else:
                         print_red("Feedback cannot be empty. Please provide your valuable feedback.")
                         print("-------------------------------")
                 elif feedback == 'no':
-                    break
+                    return None
                 else:
                     print_red("Invalid input. Please answer 'yes' or 'no'")
                     print("-------------------------------")
@@ -204,68 +2741,195 @@ class StoreOperations(FileManagement):
             print_red(f'Invalid Input.\n{ve}')
             print('-------------------------------')
 
-    def Payment_plan(self):
+    def Payment_plan(self, payment=None, card=None):
+        # Passing payment selects it without prompting and raises ValueError if it is invalid
+        if payment is not None:
+            return self.select_payment(payment, card)
         while True:
             try:
-                payment = input('\nWhich type of payment would you like to proceed with:\n\t1. Cash-On-Delivery\n\t2. Card\nEnter your response here: ').lower().strip()
-                if payment == '1' or payment == 'cash-on-delivery' or payment == 'cod':
-                    print_green('\nYou Have Selected Cash-On Delivery.\nRider will collect the Payment at your Doorstep\nYour Order will be delivered to you in 4-5 working days')
-                    break
-                elif payment == '2' or payment == 'card':
+                payment = input('\nWhich type of payment would you like to proceed with:\n\t1. Cash-On-Delivery\n\t2. Card\nEnter your response here: ')
+                if payment.lower().strip() in ('2', 'card'):
                     card = input("Enter Your Card Details: ")
-                    if card.strip():  # Checks if card details are not empty after stripping whitespace
-                        print_green("Processing payment with card details:", card, '\nYour Order will be delivered to you in 4-5 working days\n-------------------------------')
-                        break
-                    else:
-                        raise ValueError("Card details cannot be empty.")
-                else:
-                    raise ValueError("Invalid payment type. Please choose '1' for Cash-On-Delivery or '2' for Card.")
+                return self.select_payment(payment, card)
             except ValueError as ve:
                 print_red(f'Invalid Input.\n{ve}')
                 print('-------------------------------')
 
-    def checkout(self, address, user):
-        if user.cart.items:
-            total_price = sum(item["price"] * item["quantity"] for item in user.cart.items)
-            date = datetime.now().strftime("%d-%m-%Y \t%H:%M:%S")
+    def select_payment(self, payment, card=None):
+        payment = str(payment).lower().strip()
+        if payment == '1' or payment == 'cash-on-delivery' or payment == 'cod':
+            print_green('\nYou Have Selected Cash-On Delivery.\nRider will collect the Payment at your Doorstep\nYour Order will be delivered to you in 4-5 working days')
+            return "Cash-On-Delivery"
+        elif payment == '2' or payment == 'card':
+            if card and card.strip():  # Checks if card details are not empty after stripping whitespace
+                print_green(f"Processing payment with card details: {card}\nYour Order will be delivered to you in 4-5 working days\n-------------------------------")
+                return "Card"
+            else:
+                raise ValueError("Card details cannot be empty.")
+        else:
+            raise ValueError("Invalid payment type. Please choose '1' for Cash-On-Delivery or '2' for Card.")
+
+    @instrumented("store.checkout")
+    def checkout(self, address, user, payment=None, card=None, feedback=None):
+        # Prompts for payment and feedback unless they are passed in; returns the purchase record
+        if user.cart:
+            requested = [(item["title"], item["quantity"]) for item in user.cart.items]
+            self.Payment_plan(payment, card)  # Settle payment before the cart is committed
+            items, total_price, _ = user.cart.checkout_snapshot()  # Takes the holds out of the reaper's reach and clears the cart
+            # Holds can expire while the customer is on the payment prompt; only what is still held is sold
+            sold = {item["title"]: item["quantity"] for item in items}
+            for title, quantity in requested:
+                if sold.get(title, 0) < quantity:
+                    print_red(f"Only {sold.get(title, 0)} of {quantity} {title} were still reserved; the rest was released while you were paying.")
+            if not items:
+                print_red("Your cart's reservations expired before checkout. Nothing was ordered.\n")
+                return None
+            date = datetime.now().strftime(PURCHASE_DATE_FORMAT)
             purchase_record = {
                 "username": user.username,
                 "first_name": user.first_name,
                 "last_name": user.last_name,
                 "date": date,
-                "items": user.cart.items,
+                "items": items,
                 "total_bill": total_price,
                 "address": address
             }
+            with self._ingest_lock:
+                self._ingest_lock.wait_for(lambda: not self._ingesting)
+                self._saves_in_flight += 1
+            saved = False
+            try:
+                self.storage.save_purchase_history(user.username, purchase_record)  # Returns once the record is acknowledged
+                saved = True
+            except Exception:
+                self.rollback_checkout(user, items)
+                raise
+            finally:
+                with self._ingest_lock:
+                    self._saves_in_flight -= 1
+                    if saved:
+                        for pending in self._pending.values():
+                            pending.append(purchase_record)  # Past that ingest's mark; replayed when its scan ends
+                    analytics = self._analytics  # None means a later ingest will read this order from storage
+                    recommendations = self._recommendations
+                    self._ingest_lock.notify_all()
             user.add_purchase_history(purchase_record)  # Add to user's purchase history
-            self.save_purchase_history(user.username, purchase_record)  # Save users purchase history to file
-            user.cart.items = []  # Clear cart after checkout
-            self.Payment_plan()
+            if analytics is not None:
+                analytics.record_purchase(purchase_record)  # Keep the sales aggregates current
+            if recommendations is not None:
+                recommendations.submit(purchase_record)  # Counted on the engine's worker, not here
             print_green("Checkout successful! Your order will be delivered in 4-5 working days. Thank you!\n")
-            self.feedback_form()
+            self.feedback_form(feedback if payment is not None else None)
+            return purchase_record
         else:
             print_red("Your cart is empty. Nothing to checkout.\n")
+            return None
 
-# UserOperations class (inherits from FileManagement)
-class UserOperations(FileManagement):
-    def __init__(self):
-        super().__init__()
-        self.users = self.load_users_data()
+    def rollback_checkout(self, user, items):
+        # The order was not stored: put its stock back on the shelf and re-reserve it into the cart
+        for item in items:
+            product = self.find_product(item["title"])
+            if product is None:
+                continue
+            with self.inventory.lock_for(product):
+                product.update_stock(item["quantity"])
+            user.cart.add_to_cart(product, item["quantity"])
+
+# PasswordHasher class (salted scrypt with a per-user cost factor, computed in a process pool)
+class PasswordHasher:
+    # Stored format: scrypt$n$r$p$salt$digest; a bare 64-char hex string is a legacy unsalted SHA-256
+    def __init__(self, n=2**14, r=8, p=1, workers=None):
+        self.n = n  # CPU/memory cost factor; raising it upgrades users as they log in
+        self.r = r
+        self.p = p
+        self.workers = workers  # Worker processes (None = one per core, 0 = hash inline)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._dummy_hash = None  # Verified against for unknown usernames so they take as long as real ones
 
+    def _digest(self, password, salt, n, r, p):
+        options = {"salt": salt, "n": n, "r": r, "p": p, "maxmem": 256 * n * r, "dklen": 32}
+        if self.workers == 0:
+            return hashlib.scrypt(password.encode(), **options).hex()
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # Workers start from a clean interpreter: forked from a threaded server they would inherit
+                    # its listening socket and journal descriptors (and could deadlock on a lock held mid-fork)
+                    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                    self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+                    atexit.register(self._pool.shutdown)
+        # hashlib.scrypt itself is sent to the worker, so nothing from this module needs pickling
+        return self._pool.submit(hashlib.scrypt, password.encode(), **options).result().hex()
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        return f"scrypt${self.n}${self.r}${self.p}${salt.hex()}${self._digest(password, salt, self.n, self.r, self.p)}"
+
+    def verify(self, password, stored):
+        if stored is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hash("")
+            self.verify(password, self._dummy_hash)
+            return False
+        if stored.startswith("scrypt$"):
+            _, n, r, p, salt, digest = stored.split("$")
+            candidate = self._digest(password, bytes.fromhex(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(candidate, digest)
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+    def needs_rehash(self, stored):
+        # Legacy SHA-256 records and records hashed with old cost parameters
+        if not stored.startswith("scrypt$"):
+            return True
+        _, n, r, p, _, _ = stored.split("$")
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+# UserOperations class (accounts and logins over a StorageBackend)
+class UserOperations:
+    def __init__(self, database_dir="database", codec="jsonl", hasher=None, storage="files"):
+        self.storage = open_storage(storage, database_dir, codec)  # A StorageBackend, or the name of one to open
+        self.hasher = hasher or PasswordHasher()
+        self.users = self.storage.load_users_data()  # username -> User
+        self._signup_lock = threading.Lock()  # Makes the username check and insert one step
+
+    def validate_account(self, first_name, last_name, username):
+        if not first_name or not last_name or not username:
+            raise ValueError("First-Name, Last-Name, and Username cannot be empty.")
+
+        if not (first_name.isalpha() and last_name.isalpha()):
+            raise ValueError("First-Name and Last-Name must contain only alphabets.")
+
+    @instrumented("user.register")
+    def register(self, first_name, last_name, username, password):
+        # Non-interactive account creation with the same rules as create_account
+        self.validate_account(first_name, last_name, username)
+        if len(password) < 8:
+            raise ValueError("Password does not meet criteria (must be at least 8 characters long).")
+        hashed_password = self.hasher.hash(password)
+        with self._signup_lock:
+            if username in self.users:
+                raise ValueError("Username already exists. Please choose a different username.")
+            new_user = User(first_name, last_name, username, hashed_password)
+            self.users[username] = new_user
+        self.storage.save_user(new_user, self.users)  # Append the new account to the users log
+        return new_user
+
+    @instrumented("user.create_account")
     def create_account(self):
         while True:
             try:
                 first_name = input("Enter your first name: ").strip()
                 last_name = input("Enter your last name: ").strip()
                 username = input("Enter your username: ").strip()
+                self.validate_account(first_name, last_name, username)
 
-                if not first_name or not last_name or not username:
-                    raise ValueError("First-Name, Last-Name, and Username cannot be empty.")
-
-                if not (first_name.isalpha() and last_name.isalpha()):
-                    raise ValueError("First-Name and Last-Name must contain only alphabets.")
-
-                if any(user.username == username for user in self.users):
+                if username in self.users:
                     print_red("Username already exists. Please choose a different username.")
                     continue
                 password = input("Enter a unique password: ")
@@ -273,27 +2937,458 @@ class UserOperations(FileManagement):
                 if password != confirm_password or len(password) < 8:
                     print_red("Passwords do not match or Password does not meet criteria (must be at least 8 characters long). Please try again.")
                     continue
-                hashed_password = hashlib.sha256(password.encode()).hexdigest()
-                new_user = User(first_name, last_name, username, hashed_password)
-                self.users.append(new_user)
-                self.save_users_data(self.users)  # Save user data after creation
+                self.register(first_name, last_name, username, password)
                 print_green("Account created successfully!\n")
                 break
             except Exception as e:
                 print_red(f"Invalid Input.\n{e}")
 
+    @instrumented("user.authenticate")
+    def authenticate(self, username, password):
+        # Returns the User for valid credentials, otherwise None
+        user = self.users.get(username)
+        if not self.hasher.verify(password, user.password if user is not None else None):
+            return None
+        if self.hasher.needs_rehash(user.password):
+            # Upgrade legacy SHA-256 (or old-cost) records now that we know the plain password
+            user.password = self.hasher.hash(password)
+            user.user_data["password"] = user.password
+            self.storage.save_user(user, self.users)
+        user.history_loader = self.storage.load_purchase_history  # Purchase history loads lazily on first view
+        return user
+
+    @instrumented("user.login")
     def login(self):
         username = input("Enter your username: ")
         password = input("Enter your password: ")
-        password = hashlib.sha256(password.encode()).hexdigest()  # Hash the password
-        for user in self.users:
-            if user.username == username and user.password == password:
-                print_green(f"\nWelcome {user.first_name} {user.last_name}!")
-                user.purchase_history = self.load_purchase_history(user.username)  # Load purchase history
-                return user
+        user = self.authenticate(username, password)
+        if user is not None:
+            print_green(f"\nWelcome {user.first_name} {user.last_name}!")
+            return user
         print_red("\nInvalid username or password.")
         return None
 
+# SessionManager class (session tokens over a bounded LRU of logged-in users; idle carts spill to disk)
+class SessionManager:
+    def __init__(self, store, users, capacity=1024, idle_timeout=300, session_timeout=3600, reap_interval=5):
+        self.store = store  # StoreOperations: holds cart stock and stores spilled carts
+        self.users = users  # username -> User, as loaded by UserOperations
+        self.capacity = capacity  # Most users kept in memory with their carts and loaded history
+        self.idle_timeout = idle_timeout  # Seconds without a request before a user's cart is spilled
+        self.session_timeout = session_timeout  # Seconds without a request before a token stops working
+        self.reap_interval = reap_interval
+        self.tokens = collections.OrderedDict()  # session token -> [username, last used]; least recently used first
+        self.session_counts = collections.Counter()  # username -> open sessions
+        self.active = collections.OrderedDict()  # username -> [User, last used, pins]; least recently used first
+        self.spills = 0
+        self.restores = 0
+        self._ended = []  # Users whose last session ended; spilled on the next reap
+        self._lock = threading.Lock()  # Guards the maps above; never held across disk I/O
+        self._io_locks = [threading.Lock() for _ in range(64)]  # Striped by username: one spill or restore per user at a time
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def __len__(self):
+        return len(self.active)
+
+    def _io_lock(self, username):
+        return self._io_locks[hash(username) % len(self._io_locks)]
+
+    # open, close, acquire and reap may read or write spilled carts; call them off the event loop
+    def open(self, user):
+        # Start a session for an authenticated user and return its token; a spilled cart comes back with it
+        token = secrets.token_hex(16)
+        with self._lock:
+            self.tokens[token] = [user.username, time.monotonic()]
+            self.session_counts[user.username] += 1
+        self.release(self.acquire(token))
+        return token
+
+    def close(self, token):
+        # End a session; once the user's last session ends their cart is spilled for the next login
+        with self._lock:
+            session = self.tokens.pop(token, None)
+            if session is None:
+                raise PermissionError("Login required.")
+            self._session_ended(session[0])
+        self.reap()
+
+    def _session_ended(self, username):
+        self.session_counts[username] -= 1
+        if not self.session_counts[username]:
+            del self.session_counts[username]
+            self._ended.append(username)
+
+    def username(self, token):
+        # The session's username; only touches memory, so it is safe on the event loop
+        with self._lock:
+            session = self.tokens.get(token)
+            if session is None:
+                raise PermissionError("Login required.")
+            session[1] = time.monotonic()
+            self.tokens.move_to_end(token)
+            return session[0]
+
+    def acquire(self, token):
+        # Pin the session's user in memory, restoring a spilled cart first; pair with release()
+        username = self.username(token)
+        while True:
+            with self._lock:
+                entry = self.active.get(username)
+                if entry is not None:
+                    entry[1] = time.monotonic()
+                    entry[2] += 1
+                    self.active.move_to_end(username)
+                    user = entry[0]
+                    break
+            with self._io_lock(username):  # Waits for a spill of this user that is still being written
+                with self._lock:
+                    if username in self.active:
+                        continue  # Another request restored it meanwhile
+                user = self.users[username]
+                self.store.attach_cart(user)
+                self._restore(user)
+                with self._lock:
+                    self.active[username] = [user, time.monotonic(), 1]
+                break
+        self.reap()
+        return user
+
+    def release(self, user):
+        with self._lock:
+            entry = self.active.get(user.username)
+            if entry is not None:
+                entry[2] -= 1
+
+    @contextlib.contextmanager
+    def use(self, token):
+        user = self.acquire(token)
+        try:
+            yield user
+        finally:
+            self.release(user)
+
+    def reap(self, now=None):
+        # Expire idle tokens, then spill users that have logged out, are over capacity or are idle, oldest first
+        now = time.monotonic() if now is None else now
+        victims = []
+        with self._lock:
+            while self.tokens:
+                token, (username, last_used) = next(iter(self.tokens.items()))
+                if now - last_used < self.session_timeout:
+                    break
+                del self.tokens[token]
+                self._session_ended(username)
+            candidates, self._ended = self._ended, []
+            over = len(self.active) - self.capacity
+            for username, (_, last_used, _) in self.active.items():
+                if len(candidates) >= over and now - last_used < self.idle_timeout:
+                    break  # Everything after this was used more recently
+                candidates.append(username)
+            for username in dict.fromkeys(candidates):
+                entry = self.active.get(username)
+                if entry is None or entry[2]:
+                    continue  # Already spilled, or pinned by a request in progress
+                io_lock = self._io_lock(username)
+                if not io_lock.acquire(blocking=False):
+                    continue  # Its stripe is busy; a later reap gets it
+                del self.active[username]
+                victims.append((entry[0], io_lock))
+        for user, io_lock in victims:
+            try:
+                self._spill(user)
+            finally:
+                io_lock.release()
+        return len(victims)
+
+    def _spill(self, user):
+        cart = user.detach_cart()
+        if cart is None or not cart.lines:
+            return
+        items = cart.items
+        self.store.storage.save_cart(user.username, items)
+        for item in items:
+            self.store.inventory.release(cart, item["title"])  # Stock goes back on sale while the cart is on disk
+        with self._lock:
+            self.spills += 1
+        if METRICS.enabled:
+            METRICS.increment("sessions.spills")
+
+    def _restore(self, user):
+        # Re-reserve a spilled cart; lines whose stock has sold out meanwhile shrink or drop
+        items = self.store.storage.load_cart(user.username)
+        if not items:
+            return
+        for item in items:
+            product = self.store.find_product(item["title"])
+            if product is not None and product.stock_quantity > 0:
+                user.cart.add_to_cart(product, min(item["quantity"], product.stock_quantity))
+        self.store.storage.delete_cart(user.username)
+        with self._lock:
+            self.restores += 1
+        if METRICS.enabled:
+            METRICS.increment("sessions.restores")
+
+    def start_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            self.reap()
+
+    def close_all(self):
+        # Spill every cart still in memory (e.g. on shutdown) so the next login gets it back
+        self._stop.set()
+        with self._lock:
+            users = [entry[0] for entry in self.active.values()]
+            self.active.clear()
+        for user in users:
+            self._spill(user)
+
+# StoreService class (asyncio HTTP/JSON front end over StoreOperations and UserOperations)
+class StoreService:
+    def __init__(self, store, user_ops, host="127.0.0.1", port=8080, sessions=None):
+        self.store = store
+        self.user_ops = user_ops
+        self.host = host
+        self.port = port
+        self.sessions = sessions if sessions is not None else SessionManager(store, user_ops.users)  # Bearer tokens and the users behind them
+        self._connections = set()  # Tasks serving a connection, awaited at shutdown
+        self._idle = set()  # Writers of connections waiting for their next request, closed at shutdown
+        self._stopping = asyncio.Event()
+        self.routes = {
+            ("POST", "/signup"): self.signup,
+            ("POST", "/login"): self.login,
+            ("POST", "/logout"): self.logout,
+            ("GET", "/products"): self.products,
+            ("GET", "/cart"): self.view_cart,
+            ("POST", "/cart/add"): self.add_to_cart,
+            ("POST", "/cart/remove"): self.remove_from_cart,
+            ("POST", "/checkout"): self.checkout,
+            ("GET", "/history"): self.history,
+            ("GET", "/analytics"): self.sales_analytics,
+            ("GET", "/recommendations"): self.recommendations,
+            ("GET", "/metrics"): self.metrics,
+        }
+
+    async def run_blocking(self, fn, *args):
+        # File I/O and hashing run on the default executor so the event loop keeps serving
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    @contextlib.asynccontextmanager
+    async def session(self, token):
+        # The session's user, pinned in memory for the request; restoring a spilled cart reads disk, so it runs off the loop
+        user = await self.run_blocking(self.sessions.acquire, token)
+        try:
+            yield user
+        finally:
+            self.sessions.release(user)
+
+    async def serve_forever(self):
+        # Serves until SIGTERM, then returns normally: asyncio.run cancels the idle connections and atexit
+        # flushes orders, spills carts and shuts the hashing pool down from a clean state
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        if hasattr(signal, "SIGTERM"):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._stopping.set)
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            for writer in list(self._idle):
+                writer.close()  # Its pending read ends, so the connection finishes normally
+            if self._connections:
+                await asyncio.wait(self._connections)  # Requests already being handled still get their responses
+
+    async def handle_connection(self, reader, writer):
+        self._connections.add(asyncio.current_task())
+        try:
+            while not self._stopping.is_set():
+                self._idle.add(writer)
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                finally:
+                    self._idle.discard(writer)
+                headers = {}
+                try:
+                    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                    method, target, _ = request_line.split(" ", 2)
+                    for line in header_lines:
+                        if ":" in line:
+                            name, value = line.split(":", 1)
+                            headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(f"negative Content-Length {length}")
+                except ValueError as e:
+                    # The rest of the stream can't be framed, so answer and close
+                    status, payload = 400, {"error": f"Malformed request: {e}"}
+                    headers["connection"] = "close"
+                else:
+                    try:
+                        body = await reader.readexactly(length)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+                    status, payload = await self.dispatch(method, target, headers, body)
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"  # Prometheus exposition
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                keep_alive = headers.get("connection", "").lower() != "close" and not self._stopping.is_set()
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    async def dispatch(self, method, target, headers, body):
+        path, _, query = target.partition("?")
+        handler = self.routes.get((method, path))
+        if handler is None:
+            return 404, {"error": f"No route for {method} {path}"}
+        with METRICS.timer(f"http.{method} {path}"):
+            return await self.handle_request(handler, query, headers, body)
+
+    async def handle_request(self, handler, query, headers, body):
+        try:
+            request = json.loads(body) if body else {}
+            if not isinstance(request, dict):
+                raise ValueError("the body must be a JSON object")
+            request.update(urllib.parse.parse_qsl(query))
+            token = headers.get("authorization", "").removeprefix("Bearer ").strip()
+            return await handler(request, token)
+        except PermissionError as e:
+            return 401, {"error": str(e)}
+        except LibraryException as e:
+            return 404, {"error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": f"Invalid request: {e}"}
+        except Exception as e:
+            # Storage and other server-side failures still get an answer instead of a dropped connection
+            print_red(f"Error handling request: {e!r}")
+            return 500, {"error": "Internal server error."}
+
+    @staticmethod
+    def product_json(product):
+        return {"title": product.title, "price": product.price, "stock_quantity": product.stock_quantity}
+
+    def cart_json(self, cart):
+        return {"items": cart.items, "subtotal": cart.subtotal, "item_count": cart.item_count}
+
+    async def signup(self, request, token):
+        user = await self.run_blocking(self.user_ops.register, request["first_name"], request["last_name"], request["username"], request["password"])
+        return 201, {"username": user.username}
+
+    async def login(self, request, token):
+        user = await self.run_blocking(self.user_ops.authenticate, request["username"], request["password"])
+        if user is None:
+            raise PermissionError("Invalid username or password.")
+        token = await self.run_blocking(self.sessions.open, user)
+        return 200, {"token": token, "first_name": user.first_name, "last_name": user.last_name}
+
+    async def logout(self, request, token):
+        await self.run_blocking(self.sessions.close, token)  # Spills the cart
+        return 200, {"logged_out": True}
+
+    async def products(self, request, token):
+        limit = int(request.get("limit", 50))
+        if "prefix" in request:
+            products = self.store.search_products(request["prefix"], limit)
+        elif "min_price" in request or "max_price" in request:
+            min_price = int(request["min_price"]) if "min_price" in request else None
+            max_price = int(request["max_price"]) if "max_price" in request else None
+            products = self.store.products_in_price_range(min_price, max_price, limit)
+        else:
+            start = int(request.get("offset", 0))
+            products = self.store.products[start:start + limit]
+        return 200, {"products": [self.product_json(product) for product in products]}
+
+    async def view_cart(self, request, token):
+        async with self.session(token) as user:
+            cart = self.cart_json(user.cart)
+            cart["also_bought"] = [title for title, _ in self.store.also_bought([item["title"] for item in cart["items"]])]
+            return 200, cart
+
+    async def add_to_cart(self, request, token):
+        async with self.session(token) as user:
+            product = self.store.find_product(request["title"])
+            if product is None:
+                raise ProductNotAvailableException(request["title"])
+            quantity = int(request.get("quantity", 1))
+            if quantity <= 0:
+                raise ValueError("Quantity must be positive.")
+            if not user.cart.add_to_cart(product, quantity):
+                return 409, {"error": f"Insufficient stock for {product.title}.", "stock_quantity": product.stock_quantity}
+            return 200, self.cart_json(user.cart)
+
+    async def remove_from_cart(self, request, token):
+        quantity = int(request.get("quantity", 1))
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive.")
+        async with self.session(token) as user:
+            if not user.cart.remove_from_cart(request["title"], quantity):
+                return 409, {"error": f"Could not remove {request['title']} from the cart."}
+            return 200, self.cart_json(user.cart)
+
+    async def checkout(self, request, token):
+        async with self.session(token) as user:  # Pinned so the cart isn't spilled while the executor works on it
+            if not user.cart:
+                return 409, {"error": "Your cart is empty. Nothing to checkout."}
+            record = await self.run_blocking(self.store.checkout, request["address"], user, request["payment"], request.get("card"), request.get("feedback", ""))
+            if record is None:
+                return 409, {"error": "Your cart's reservations expired before checkout. Nothing was ordered."}
+            return 200, {"order": record}
+
+    async def history(self, request, token):
+        username = self.sessions.username(token)
+        limit = int(request.get("limit", 10))
+        offset = int(request.get("offset", 0))
+        orders = await self.run_blocking(self.store.storage.load_purchase_history, username, limit, offset)
+        return 200, {"orders": orders[::-1]}  # Newest first
+
+    async def recommendations(self, request, token):
+        # "Also bought" for one product with ?title=, otherwise for the session's cart
+        k = int(request.get("limit", 5))
+        if "title" in request:
+            recommendations = await self.run_blocking(lambda: self.store.recommendations)  # The first call scans stored histories
+            suggestions = recommendations.also_bought(request["title"], k)
+        else:
+            async with self.session(token) as user:
+                titles = [item["title"] for item in user.cart.items]
+            recommendations = await self.run_blocking(lambda: self.store.recommendations)
+            suggestions = recommendations.for_cart(titles, k)
+        return 200, {"also_bought": [{"title": title, "orders": count} for title, count in suggestions]}
+
+    async def sales_analytics(self, request, token):
+        self.sessions.username(token)
+        since = datetime.strptime(request["since"], "%Y-%m-%d") if "since" in request else None
+        analytics = await self.run_blocking(lambda: self.store.analytics)  # The first call scans stored histories
+        return 200, {
+            "top_sellers": analytics.top_sellers(int(request.get("limit", 10)), request.get("by", "revenue"), since),
+            "revenue_by_day": {day.isoformat(): revenue for day, revenue in analytics.revenue_by_day(since).items()},
+            "orders": analytics.orders,
+            "average_basket_size": analytics.average_basket_size(),
+            "average_basket_value": analytics.average_basket_value(),
+        }
+
+    async def metrics(self, request, token):
+        if request.get("format") == "json":
+            return 200, METRICS.to_json()
+        if request.get("format") == "profile":
+            return 200, METRICS.profile_report()
+        return 200, METRICS.to_prometheus()
+
+HTTP_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 409: "Conflict", 500: "Internal Server Error"}
+
 # Operator overloading
 class LibrarySystem:
     def __init__(self, store_operations):
@@ -323,12 +3418,71 @@ def print_green(text):
 
 # Main program
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Super Store shopping app")
+    parser.add_argument("--codec", choices=sorted(RECORD_CODECS), default="jsonl", help="record format for new database files")
+    parser.add_argument("--migrate", action="store_true", help="rewrite database/*.txt into --codec, move purchase histories into the order log, and exit")
+    parser.add_argument("--database-dir", default="database", help="where users and purchase histories are stored")
+    parser.add_argument("--storage", choices=sorted(STORAGE_BACKENDS), default=os.environ.get("SHOP_STORAGE", "files"), help="storage backend (default: $SHOP_STORAGE or files)")
+    parser.add_argument("--import-from", choices=sorted(STORAGE_BACKENDS), help="copy users, catalog, carts and orders from this backend into --storage and exit")
+    parser.add_argument("--fsync", choices=PurchaseWriter.FSYNC_POLICIES, default="batch", help="when purchase records are fsynced")
+    parser.add_argument("--scrypt-n", type=int, default=2**14, help="scrypt cost factor for new and upgraded passwords")
+    parser.add_argument("--hash-workers", type=int, default=None, help="password hashing processes (0 = hash inline)")
+    parser.add_argument("--metrics", action="store_true", default=os.environ.get("SHOP_METRICS") == "1", help="collect timings (dump with SIGUSR1 or GET /metrics)")
+    parser.add_argument("--profile-rate", type=float, default=0.0, help="fraction of instrumented calls to run under cProfile")
+    parser.add_argument("--trace-memory", action="store_true", help="track allocations with tracemalloc")
+    parser.add_argument("--serve", action="store_true", help="run the HTTP/JSON service instead of the menu")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--session-capacity", type=int, default=1024, help="logged-in users kept in memory with their carts")
+    parser.add_argument("--session-idle", type=float, default=300, help="seconds before an idle user's cart is spilled to disk")
+    parser.add_argument("--session-timeout", type=float, default=3600, help="seconds before an idle session token expires")
+    args = parser.parse_args()
+    if args.migrate:
+        files = FileManagement(args.database_dir, codec=args.codec)
+        migrated = files.migrate_database()
+        files.close()
+        print_green(f"Migrated {migrated} database files to {args.codec}.")
+        exit()
+    if args.import_from:
+        if args.import_from == args.storage:
+            parser.error("--import-from and --storage must name different backends")
+        source = open_storage(args.import_from, args.database_dir, args.codec)
+        target = open_storage(args.storage, args.database_dir, args.codec)
+        users, products, orders = import_storage(source, target)
+        source.close()
+        target.close()
+        print_green(f"Imported {users} users, {products} products and {orders} orders from {args.import_from} into {args.storage}.")
+        exit()
+
+    if args.metrics or args.profile_rate or args.trace_memory:
+        METRICS.enable(args.profile_rate, args.trace_memory)
+        if hasattr(signal, "SIGUSR1"):
+            # kill -USR1 <pid> writes the current metrics next to the database
+            dump_lock = threading.Lock()  # Back-to-back signals must not interleave writes to the same files
+
+            def write_metrics():
+                with dump_lock:
+                    METRICS.dump(os.path.join(args.database_dir, "metrics.prom"))
+                    METRICS.dump(os.path.join(args.database_dir, "metrics.json"))
+                    if METRICS.profile_stats is not None or tracemalloc.is_tracing():
+                        with open(os.path.join(args.database_dir, "profile.txt"), 'w') as f:
+                            f.write(METRICS.profile_report())
+
+            def dump_metrics(signum, frame):
+                # The handler interrupts the main thread, which may be holding the (non-reentrant) metrics locks,
+                # so the dump runs on its own thread and waits for them like any other reader
+                threading.Thread(target=write_metrics, name="metrics-dump", daemon=True).start()
+            signal.signal(signal.SIGUSR1, dump_metrics)
+
     store_name = "Super Store"  # Define your store name
-    store = StoreOperations(store_name)  # Initialize StoreOperations with store name
-    user_ops = UserOperations()
+    storage = open_storage(args.storage, args.database_dir, args.codec)  # Shared by the store and the user accounts
+    atexit.register(storage.close)  # Registered first so it runs last, after orders, carts and stock are written
+    store = StoreOperations(store_name, args.database_dir, codec=args.codec, fsync_policy=args.fsync, storage=storage)  # Initialize StoreOperations with store name
+    user_ops = UserOperations(args.database_dir, codec=args.codec, hasher=PasswordHasher(args.scrypt_n, workers=args.hash_workers), storage=storage)
     # Initialize LibrarySystem with StoreOperations
     library_system = LibrarySystem(store)
-    file_manager=FileManagement()
+    sessions = SessionManager(store, user_ops.users, args.session_capacity, args.session_idle, args.session_timeout)
+    atexit.register(sessions.close_all)  # Spill carts still in memory so they are back at the next login
     # Adding products to the store
     product_list = [
         {"title": "Hoodie", "price": 9999, "stock_quantity": 10},
@@ -342,8 +3496,21 @@ if __name__ == "__main__":
         {"title": "Leather-Jacket", "price": 14999, "stock_quantity": 5},
         {"title": "Ripped-Jeans", "price": 4999, "stock_quantity": 6}
     ]
-    for product in product_list:
-        store.add_product(**product)
+    if not len(store.products):  # First run: seed the persisted catalog
+        for product in product_list:
+            store.add_product(**product)
+
+    if args.serve:
+        print_green(f"Serving {store_name} on http://{args.host}:{args.port}")
+        sessions.start_reaper()
+        service = StoreService(store, user_ops, args.host, args.port, sessions)
+        # Store operations still print their console messages; keep them off the service's output
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            try:
+                asyncio.run(service.serve_forever())
+            except KeyboardInterrupt:
+                pass
+        exit()
 
     # Welcome message
     print('.................................................................')
@@ -361,6 +3528,7 @@ if __name__ == "__main__":
         if choice == "1":
             logged_in_user = user_ops.login()
             if logged_in_user:
+                session_token = sessions.open(logged_in_user)  # Also restores the cart left at the last logout
                 while True:
                     print("-------------------------------\n• Logged-in Home-Page:\n")
                     print("1. View Products")
@@ -383,19 +3551,29 @@ if __name__ == "__main__":
                         store.display_products()
                         if store.products:
                             try:
-                                product_index = input("\nEnter the product index to add to cart: ")
-                                if not product_index.isdigit():
-                                    raise ValueError("Invalid Input.\nPlease enter an Integer Value")
-                                product_index=int(product_index)
-                                if 1 <= product_index <= len(store.products):
-                                    selected_product = store.products[product_index - 1]
+                                product_index = input("\nEnter the product index or title to add to cart: ").strip()
+                                selected_product = None
+                                if product_index.isdigit():
+                                    product_index=int(product_index)
+                                    if 1 <= product_index <= len(store.products):
+                                        selected_product = store.products[product_index - 1]
+                                elif product_index:
+                                    selected_product = store.find_product(product_index)
+                                    if selected_product is None:
+                                        # Fall back to a prefix search and only accept an unambiguous match
+                                        matches = store.search_products(product_index)
+                                        if len(matches) == 1:
+                                            selected_product = matches[0]
+                                        elif matches:
+                                            print_red("Did you mean: " + ", ".join(product.title for product in matches))
+                                if selected_product is not None:
                                     quantity = input(f"Enter quantity for '{selected_product.title}': ")
                                     if not quantity.isdigit():
                                         raise ValueError("Invalid Input.\nPlease enter an Integer Value")
                                     quantity=int(quantity)
                                     logged_in_user.cart.add_to_cart(selected_product, quantity)
                                 else:
-                                    print_red("Invalid product index.")
+                                    print_red("Invalid product index or title.")
                             except ValueError as e:
                                 print_red(e)
                         else:
@@ -408,20 +3586,14 @@ if __name__ == "__main__":
                     elif logged_in_choice == "4":
                         print("-------------------------------\nCurrent Cart Info:\t",datetime.now().strftime("%d %B,%Y\t%H:%M:%S"),'\n')
                         logged_in_user.cart.view_cart()
-                        if logged_in_user.cart.items:
+                        if logged_in_user.cart:
                             product_title = input("Enter the product title to remove from cart: ")
                             try:
                                 quantity = input(f"Enter quantity to remove for '{product_title}': ")
                                 if not quantity.isdigit():
                                     raise ValueError("Invalid Input.\nEnter An Integeric Value")
                                 quantity=int(quantity)
-                                removed_quantity=logged_in_user.cart.remove_from_cart(product_title, quantity)
-                                if removed_quantity>0:
-                                    #Update Store Product stock
-                                    for product in store.products:
-                                        if product.title.lower() == product_title.lower():
-                                            product.update_stock(removed_quantity)
-                                            break           
+                                logged_in_user.cart.remove_from_cart(product_title, quantity)  # Also returns the stock to the store
                             except ValueError as ve:
                                 print_red(ve)  
                         else:
@@ -429,7 +3601,7 @@ if __name__ == "__main__":
                     elif logged_in_choice == "5":
                         while True:
                             try:
-                                if logged_in_user.cart.items:
+                                if logged_in_user.cart:
                                     residence = str(input("-------------------------------\nPlease enter your address of residence: "))
                                     famous_location = str(input("Enter a famous location near your area of residence: "))
                                     city = str(input("Enter your city where you reside: "))
@@ -447,10 +3619,11 @@ if __name__ == "__main__":
                                 print_red(f'Invalid Input.\n{ve}')
 
                     elif logged_in_choice == "6":
-                        logged_in_user.view_purchase_history(file_manager)
+                        logged_in_user.view_purchase_history(storage)
 
                     elif logged_in_choice == "7":
                         print("-------------------------------")
+                        sessions.close(session_token)  # The cart is saved for the next login
                         print_green(f"Logged out successfully.\nThank you for visiting our store.\nHave a nice day, {logged_in_user.username}!")
                         print(".................................................................")
                         exit()